@@ -0,0 +1,4 @@
+# Shared helpers of the medallion notebooks, import them from a notebook folder with:
+#   import sys
+#   sys.path.append("..")
+#   from pipeline_utils.bronze_manifest import visible_bronze_files
@@ -0,0 +1,86 @@
+import os
+import time
+
+import pandas as pd
+
+# Shared scaffold of the benchmarks and checks of pipeline_utils (python -m pipeline_utils.benchmark_...):
+# settings from the environment, best-of-n timing, the input data of the exercises and a frozen copy of the former
+# row-wise classifications of the batch silver notebook - the reference the vectorized classifiers are compared with.
+
+INPUT_DATA = os.path.join(os.path.dirname(__file__), "..", "..", "input_data")
+
+
+def env_int(key: str, default: int) -> int:
+    return int(os.getenv(key, str(default)))
+
+
+def env_float(key: str, default: float) -> float:
+    return float(os.getenv(key, str(default)))
+
+
+# comma separated integers, e.g. BENCHMARK_FILES=10,1000,10000
+def env_ints(key: str, default: str) -> list[int]:
+    return [int(value) for value in os.getenv(key, default).split(",")]
+
+
+# the fastest of repeat runs of function and its (last) result
+def best_of(function, repeat: int = 1):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def speedup(baseline: float, elapsed: float) -> str:
+    return f"  speedup: {baseline / elapsed:6.1f}x" if baseline else ""
+
+
+def read_input(name: str) -> pd.DataFrame:
+    return pd.read_csv(os.path.join(INPUT_DATA, name), parse_dates=["date"])
+
+
+def retail_sales() -> pd.DataFrame:
+    return read_input("retail_sales_2023_2024.csv")
+
+
+def daily_weather() -> pd.DataFrame:
+    return read_input("weather_2023_2024.csv")
+
+
+# former implementation (Series.apply, one python call per row), kept unchanged as the reference
+def rowwise_season(month):
+    if month in [12, 1, 2]:
+        return "Winter"
+    elif month in [3, 4, 5]:
+        return "Spring"
+    elif month in [6, 7, 8]:
+        return "Summer"
+    else:
+        return "Autumn"
+
+
+def rowwise_temperature(temp):
+    if temp < 0:
+        return "Freezing"
+    elif temp < 10:
+        return "Cold"
+    elif temp < 20:
+        return "Mild"
+    else:
+        return "Warm"
+
+
+def rowwise_wind(speed):
+    if speed < 1:
+        return "Calm"
+    elif speed < 5:
+        return "Light Breeze"
+    elif speed < 11:
+        return "Breeze"
+    elif speed < 19:
+        return "Windy"
+    else:
+        return "Storm"
@@ -0,0 +1,92 @@
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from pipeline_utils.benchmark import best_of, daily_weather, env_int, retail_sales
+from pipeline_utils.classifiers import (CATEGORICAL_COLUMNS, PRODUCT_LOOKUP, STORE_LOOKUP, categorize, season,
+                                        temperature_category, wind_category)
+
+# Benchmark of the categorical (dictionary encoded) columns on the combined retail x weather gold set: the same
+# frame with season/categories/store/product as python object strings and as categoricals.
+# Compared: memory of the frame, size of the parquet file, reading it back, the filter of the dashboard (isin on
+# store/product/season) and a grouping. The sales are repeated BENCHMARK_SCALE times.
+#   cd 3_pipeline/notebooks && python -m pipeline_utils.benchmark_categoricals
+
+REPEAT = 5
+
+
+# the combined gold set as written by the gold notebook (merge of the silver tables on the date)
+def load_combined(scale: int) -> pd.DataFrame:
+    weather = daily_weather()
+    retail = pd.concat([retail_sales()] * scale, ignore_index=True)
+    retail["season"] = season(retail["date"].dt.month)
+    retail["store_name"] = retail["store_id"].map(STORE_LOOKUP)
+    retail["product_name"] = retail["product_id"].map(PRODUCT_LOOKUP)
+    weather["season"] = season(weather["date"].dt.month)
+    weather["temperature_category"] = temperature_category(weather["temperature"])
+    weather["wind_category"] = wind_category(weather["wind_speed"])
+    return retail.merge(weather, on="date", how="inner")
+
+
+def categorical_columns(df: pd.DataFrame) -> list[str]:
+    return [column for column in df.columns
+            if (column[:-2] if column.endswith(("_x", "_y")) else column) in CATEGORICAL_COLUMNS]
+
+
+def run(df: pd.DataFrame, columns: list[str]) -> dict:
+    buffer = BytesIO()
+    df.to_parquet(buffer, engine="pyarrow", index=False)
+    body = buffer.getvalue()
+    stores, products, seasons = ["Linz Mall", "Graz Hauptplatz"], ["Beer", "Coffee", "Tea", "Milk"], ["Summer"]
+
+    def select():
+        return df[df["store_name"].isin(stores) & df["product_name"].isin(products) & df["season_x"].isin(seasons)]
+
+    def group():
+        return df.groupby(["store_name", "product_name", "season_x"], observed=True)["revenue"].sum()
+
+    read_seconds, _ = best_of(lambda: pq.read_table(BytesIO(body)).to_pandas(), REPEAT)
+    filter_seconds, selected = best_of(select, REPEAT)
+    group_seconds, grouped = best_of(group, REPEAT)
+    return {
+        "memory (MB)": df[columns].memory_usage(deep=True, index=False).sum() / 2 ** 20,
+        "parquet (MB)": len(body) / 2 ** 20,
+        "read (s)": read_seconds,
+        "filter (s)": filter_seconds,
+        "group by (s)": group_seconds,
+        "_selected": selected,
+        "_grouped": grouped,
+    }
+
+
+# the grouped revenue with the keys as strings, for the comparison of both runs
+def grouped_table(run_result: dict) -> pd.DataFrame:
+    keys = ["store_name", "product_name", "season_x"]
+    return run_result["_grouped"].reset_index().astype(dict.fromkeys(keys, str)).sort_values(keys, ignore_index=True)
+
+
+def main():
+    scale = env_int("BENCHMARK_SCALE", 30)
+    combined = load_combined(scale)
+    columns = categorical_columns(combined)
+    print(f"Combined gold set: {len(combined):,} rows, categorical columns: {', '.join(columns)}")
+
+    strings = combined.astype({column: object for column in columns})
+    categoricals = categorize(combined.copy())
+    baseline, result = run(strings, columns), run(categoricals, columns)
+
+    print(f"{'':14s} {'strings':>10s} {'categorical':>12s} {'ratio':>8s}")
+    for metric in [name for name in baseline if not name.startswith("_")]:
+        print(f"{metric:14s} {baseline[metric]:10.3f} {result[metric]:12.3f} {baseline[metric] / result[metric]:7.1f}x")
+
+    assert len(baseline["_selected"]) == len(result["_selected"]), "filter results differ"
+    expected, grouped = grouped_table(baseline), grouped_table(result)
+    assert expected.drop(columns="revenue").equals(grouped.drop(columns="revenue")) \
+        and np.allclose(expected["revenue"], grouped["revenue"]), "group by results differ"
+    print("Results are identical")
+
+
+if __name__ == "__main__":
+    main()
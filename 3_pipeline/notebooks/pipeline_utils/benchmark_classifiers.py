@@ -0,0 +1,71 @@
+import duckdb
+import numpy as np
+import pandas as pd
+
+from pipeline_utils.benchmark import (best_of, daily_weather, env_int, retail_sales, rowwise_season,
+                                      rowwise_temperature, rowwise_wind, speedup)
+from pipeline_utils.classifiers import register_macros, season, temperature_category, wind_category
+
+# Benchmark of the silver classifications: row-wise Series.apply (the former implementation of the batch silver
+# notebook, frozen in pipeline_utils/benchmark.py) vs. the vectorized pandas functions vs. the DuckDB macros.
+# The retail sales are joined with the weather of the day and repeated BENCHMARK_SCALE times.
+#   cd 3_pipeline/notebooks && python -m pipeline_utils.benchmark_classifiers
+
+EDGE_CASES = pd.DataFrame({
+    "month": [12, 3, 6, 9, np.nan],
+    "temperature": [0.0, 10.0, 20.0, -0.1, np.nan],
+    "wind_speed": [1.0, 5.0, 11.0, 19.0, np.nan],
+})
+
+
+def load_data(scale: int) -> pd.DataFrame:
+    df = retail_sales().merge(daily_weather(), on="date", how="inner")
+    data = pd.DataFrame({
+        "month": np.tile(df["date"].dt.month.to_numpy(np.float64), scale),
+        "temperature": np.tile(df["temperature"].to_numpy(), scale),
+        "wind_speed": np.tile(df["wind_speed"].to_numpy(), scale),
+    })
+    # the bin edges and missing values are compared as well (missing values get the last category)
+    return pd.concat([data, EDGE_CASES], ignore_index=True)
+
+
+def measure(name: str, classify, df: pd.DataFrame, baseline: float = None):
+    elapsed, result = best_of(lambda: classify(df))
+    print(f"{name:12s} {elapsed:8.2f}s {len(df) / elapsed:14,.0f} rows/s{speedup(baseline, elapsed)}")
+    return elapsed, result
+
+
+def main():
+    scale = env_int("BENCHMARK_SCALE", 1000)
+    df = load_data(scale)
+    print(f"Classifying {len(df):,} rows (retail x weather, scale {scale})")
+
+    baseline, expected = measure("row-wise", lambda df: pd.DataFrame({
+        "season": df["month"].apply(rowwise_season),
+        "temperature_category": df["temperature"].apply(rowwise_temperature),
+        "wind_category": df["wind_speed"].apply(rowwise_wind),
+    }), df)
+
+    _, vectorized = measure("vectorized", lambda df: pd.DataFrame({
+        "season": season(df["month"]),
+        "temperature_category": temperature_category(df["temperature"]),
+        "wind_category": wind_category(df["wind_speed"]),
+    }), df, baseline)
+
+    conn = register_macros(duckdb.connect())
+    conn.register("data", df)
+    _, macros = measure("duckdb", lambda df: conn.execute("""
+        SELECT season(month) AS season,
+               temperature_category(temperature) AS temperature_category,
+               wind_category(wind_speed) AS wind_category
+        FROM data
+    """).fetchdf(), df, baseline)
+
+    for column in expected.columns:
+        assert (vectorized[column].astype(str) == expected[column]).all(), f"vectorized {column} differs"
+        assert (macros[column] == expected[column]).all(), f"duckdb {column} differs"
+    print("Results are identical")
+
+
+if __name__ == "__main__":
+    main()
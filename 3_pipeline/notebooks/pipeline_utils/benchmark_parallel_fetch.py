@@ -0,0 +1,102 @@
+import io
+import os
+import time
+from contextlib import closing
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pipeline_utils.benchmark import best_of, env_float, env_int, env_ints, speedup
+from pipeline_utils.parallel_fetch import fetch_objects, parquet_table, pooled_client
+
+# Benchmark of the parallel download: 10/1k/10k small parquet files (like the bronze files of the micro-batches)
+# are fetched one after another (the former loop over s3.get_object) and with fetch_objects.
+# Without BENCHMARK_S3_ENDPOINT an in-process S3 stand-in with a fixed latency per request is used, with it the
+# files are uploaded to BENCHMARK_BUCKET of e.g. the local MinIO (http://localhost:9000).
+#   cd 3_pipeline/notebooks && python -m pipeline_utils.benchmark_parallel_fetch
+
+ROWS_PER_FILE = 60
+
+
+# in-memory S3 stand-in, every request waits latency_seconds (time to first byte of MinIO/S3)
+class LatencyS3:
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        time.sleep(self.latency_seconds)
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+
+def parquet_body(i: int) -> bytes:
+    rng = np.random.default_rng(i)
+    buffer = io.BytesIO()
+    pq.write_table(pa.table({"temperature": rng.normal(10, 10, ROWS_PER_FILE),
+                             "humidity": rng.uniform(20, 100, ROWS_PER_FILE)}), buffer)
+    return buffer.getvalue()
+
+
+# the fetch generator is closed before measure returns (also on errors): the thread pool of fetch_objects is shut
+# down and joined, no download/parse threads are left running at interpreter shutdown
+def count_rows(fetch) -> int:
+    with closing(fetch()) as tables:
+        return sum(table.num_rows for _, table in tables)
+
+
+def measure(name: str, fetch, files: int, baseline: float = None) -> float:
+    elapsed, rows = best_of(lambda: count_rows(fetch))
+    assert rows == files * ROWS_PER_FILE
+    print(f"{files:7,d} files  {name:22s} {elapsed:8.2f}s {files / elapsed:10,.0f} files/s"
+          f"{speedup(baseline, elapsed)}")
+    return elapsed
+
+
+def main():
+    counts = env_ints("BENCHMARK_FILES", "10,1000,10000")
+    max_workers = env_int("BENCHMARK_MAX_WORKERS", 16)
+    latency_seconds = env_float("BENCHMARK_LATENCY_MS", 5) / 1000
+    endpoint = os.getenv("BENCHMARK_S3_ENDPOINT", "")
+    bucket = os.getenv("BENCHMARK_BUCKET", "benchmark")
+
+    if endpoint:
+        s3 = pooled_client(max_workers, endpoint_url=endpoint,
+                           aws_access_key_id=os.getenv("MINIO_ACCESS_KEY", "admin"),
+                           aws_secret_access_key=os.getenv("MINIO_SECRET_KEY", "password"))
+        if bucket not in [b["Name"] for b in s3.list_buckets().get("Buckets", [])]:
+            s3.create_bucket(Bucket=bucket)
+        print(f"S3 endpoint {endpoint}, {max_workers} threads")
+    else:
+        s3 = LatencyS3(latency_seconds)
+        print(f"S3 stand-in with {latency_seconds * 1000:.0f} ms latency per request, {max_workers} threads")
+
+    keys = [f"benchmark/part-{i:05d}.parquet" for i in range(max(counts))]
+    for i, key in enumerate(keys):
+        s3.put_object(Bucket=bucket, Key=key, Body=parquet_body(i))
+
+    try:
+        for files in counts:
+            selected = keys[:files]
+
+            def sequential():
+                for key in selected:
+                    yield key, parquet_table(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+            baseline = measure("sequential", sequential, files)
+            measure("parallel (ordered)", lambda: fetch_objects(s3, bucket, selected, max_workers=max_workers),
+                    files, baseline)
+            measure("parallel (unordered)",
+                    lambda: fetch_objects(s3, bucket, selected, max_workers=max_workers, ordered=False),
+                    files, baseline)
+    finally:
+        # the connection pool of the client is closed before the interpreter shuts down
+        if endpoint:
+            s3.close()
+
+
+if __name__ == "__main__":
+    main()
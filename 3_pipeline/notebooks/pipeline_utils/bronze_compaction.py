@@ -0,0 +1,136 @@
+import datetime
+import threading
+import time
+import uuid
+from io import BytesIO
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from pipeline_utils.bronze_manifest import (COMPACTED_PREFIX, ManifestConflict, is_compacted, list_parquet_objects,
+                                            list_partitions, partition_prefix, read_manifest, visible_objects,
+                                            write_manifest)
+from pipeline_utils.parallel_fetch import fetch_table
+
+# Compaction of the bronze date partitions: the streaming ingest creates a small file per trigger, the visible small
+# files of a partition are merged into files of a single (large) row group.
+# 1. the compacted files are written (invisible until they are part of the manifest)
+# 2. the manifest is replaced (conditional PUT): the compacted files become visible, the small files are "removed"
+# 3. the small files removed by the previous runs are deleted (readers had the time of a run to read them)
+# A failed run leaves either unreferenced compacted files or removed small files, both are ignored by the readers
+# and cleaned up by a later run.
+
+# files smaller than this are compacted
+SMALL_FILE_BYTES = 32 * 1024 * 1024
+# rows of a compacted file, written as a single row group
+ROWS_PER_FILE = 1_000_000
+# unreferenced compacted files (of failed runs) are deleted after this time - a running compaction is not affected
+ORPHAN_RETENTION_SECONDS = 3600
+
+
+def delete_objects(s3, bucket: str, keys: list[str]):
+    for i in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]], "Quiet": True})
+
+
+# manifest entry of a written file (the statistics are used by the readers)
+def file_entry(key: str, size: int, table: pa.Table) -> dict:
+    entry = {"key": key, "size": size, "rows": table.num_rows, "min_timestamp": None, "max_timestamp": None}
+    if table.num_rows > 0 and "timestamp" in table.column_names:
+        min_max = pc.min_max(table.column("timestamp"))
+        entry["min_timestamp"] = str(min_max["min"].as_py())
+        entry["max_timestamp"] = str(min_max["max"].as_py())
+    return entry
+
+
+# write the table as compacted files of the partition, sorted by time (tight min/max statistics per row group)
+def write_compacted(s3, bucket: str, date: str, table: pa.Table, rows_per_file: int) -> list[dict]:
+    if "timestamp" in table.column_names:
+        table = table.sort_by("timestamp")
+    entries = []
+    for offset in range(0, table.num_rows, rows_per_file):
+        chunk = table.slice(offset, rows_per_file)
+        buffer = BytesIO()
+        pq.write_table(chunk, buffer, row_group_size=rows_per_file)
+        key = f"{partition_prefix(date)}{COMPACTED_PREFIX}{uuid.uuid4().hex}.parquet"
+        s3.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+        entries.append(file_entry(key, buffer.tell(), chunk))
+    return entries
+
+
+# compact the small files of a single date partition, returns a summary of the run
+def compact_partition(s3, bucket: str, date: str, small_file_bytes: int = SMALL_FILE_BYTES,
+                      rows_per_file: int = ROWS_PER_FILE, min_files: int = 2) -> dict:
+    manifest, etag = read_manifest(s3, bucket, date)
+    objects = list_parquet_objects(s3, bucket, partition_prefix(date))
+    listed = {obj["key"] for obj in objects}
+    # removed files which are already deleted are not tracked anymore, the others are deleted by this run
+    manifest["removed"] = [key for key in manifest["removed"] if key in listed]
+    expired = list(manifest["removed"])
+    orphan_deadline = time.time() - ORPHAN_RETENTION_SECONDS
+    referenced = {entry["key"] for entry in manifest["files"]}
+    orphans = [obj["key"] for obj in objects if is_compacted(obj["key"]) and obj["key"] not in referenced
+               and obj["last_modified"].timestamp() < orphan_deadline]
+
+    small = [obj for obj in visible_objects(objects, manifest) if obj["size"] < small_file_bytes]
+    summary = {"date": date, "compacted_files": 0, "written_files": 0, "rows": 0}
+    if len(small) < min_files:
+        delete_objects(s3, bucket, expired + orphans)
+        return summary
+
+    small_keys = [obj["key"] for obj in small]
+    # the small files are downloaded in parallel (the latency of a request adds up over many small files)
+    table = fetch_table(s3, bucket, small_keys)
+    entries = write_compacted(s3, bucket, date, table, rows_per_file)
+    # incremental readers (see incremental_silver) skip compacted files whose sources they already processed
+    for entry in entries:
+        entry["compacted_from"] = small_keys
+
+    small_key_set = set(small_keys)
+    manifest["files"] = [entry for entry in manifest["files"] if entry["key"] not in small_key_set] + entries
+    manifest["removed"] = manifest["removed"] + small_keys
+    try:
+        write_manifest(s3, bucket, date, manifest, etag)
+    except ManifestConflict:
+        # another run changed the partition, the written files stay invisible
+        delete_objects(s3, bucket, [entry["key"] for entry in entries])
+        raise
+
+    delete_objects(s3, bucket, expired + orphans)
+
+    summary.update(compacted_files=len(small_keys), written_files=len(entries), rows=table.num_rows)
+    return summary
+
+
+# compact all (or the given) date partitions
+def compact_bronze(s3, bucket: str, dates: list[str] = None, **settings) -> list[dict]:
+    summaries = []
+    for date in dates or list_partitions(s3, bucket):
+        try:
+            summary = compact_partition(s3, bucket, date, **settings)
+        except ManifestConflict as err:
+            print(f"[{datetime.datetime.now()}] Skipped partition {date}: {err}")
+            continue
+        if summary["compacted_files"] > 0:
+            print(f"[{datetime.datetime.now()}] Compacted {summary['compacted_files']} files of {date} into "
+                  f"{summary['written_files']} file(s), {summary['rows']} rows")
+        summaries.append(summary)
+    return summaries
+
+
+# run the compaction every interval in a background thread, stop it with the returned event
+def start_background_compaction(s3, bucket: str, interval_seconds: float = 300.0, **settings):
+    stop = threading.Event()
+
+    def run():
+        while not stop.is_set():
+            try:
+                compact_bronze(s3, bucket, **settings)
+            except Exception as err:
+                print(f"[{datetime.datetime.now()}] Compaction failed: {err!r}")
+            stop.wait(interval_seconds)
+
+    thread = threading.Thread(target=run, name="bronze-compaction", daemon=True)
+    thread.start()
+    return thread, stop
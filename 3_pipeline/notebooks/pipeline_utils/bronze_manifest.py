@@ -0,0 +1,243 @@
+import json
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+# Bronze layout: bronze/date=YYYY-MM-DD/batch=<id>/part-....parquet (written by the streaming ingest in a single write,
+# partitioned by date and batch; folders of older ingests are named batch-<id>)
+# Every date partition has a manifest bronze/date=YYYY-MM-DD/_manifest.json:
+# {
+#   "version": 3,
+#   "complete": true,
+#   "files": [{"key": "...", "size": 123, "rows": 10, "min_timestamp": "...", "max_timestamp": "...",
+#              "compacted_from": [...]}, ...],
+#   "removed": [".../part-0000-....parquet", ...]
+# }
+# - the ingest appends the files of every micro-batch, the compaction replaces small files by compacted ones
+# - complete: the manifest lists every file of the partition, readers use it instead of listing the objects
+#   (partitions of older ingests have no/incomplete manifests until they are repaired, see repair_manifests)
+# - compacted files are only visible if they are listed in "files", "compacted_from" lists the files they replaced
+# - files listed in "removed" were replaced (e.g. by the compaction) and are not visible anymore
+# The manifest is replaced with a single conditional PUT, readers switch atomically from the small files to the
+# compacted ones and never see both. Removed files are deleted by a later compaction run, readers which resolved
+# the files just before the switch can still read them.
+
+BRONZE_PREFIX = "bronze/"
+MANIFEST_NAME = "_manifest.json"
+COMPACTED_PREFIX = "compacted-"
+# the parquet footer is read with a single range request of this size (larger footers need a second one)
+FOOTER_READ_BYTES = 64 * 1024
+
+
+class ManifestConflict(Exception):
+    pass
+
+
+def partition_prefix(date: str) -> str:
+    return f"{BRONZE_PREFIX}date={date}/"
+
+
+# the files of a micro-batch are written to their own folder, a replayed batch replaces them
+def batch_prefix(date: str, batch_id: int) -> str:
+    return f"{partition_prefix(date)}batch={batch_id}/"
+
+
+# the date of a bronze key (bronze/date=2025-06-01/...), None for keys outside of a date partition
+def partition_of(key: str):
+    for part in key.split("/"):
+        if part.startswith("date="):
+            return part[len("date="):]
+    return None
+
+
+def is_compacted(key: str) -> bool:
+    return key.rsplit("/", 1)[-1].startswith(COMPACTED_PREFIX)
+
+
+# list all parquet objects below the prefix (list_objects_v2 returns max. 1000 keys per call)
+def list_parquet_objects(s3, bucket: str, prefix: str) -> list[dict]:
+    objects = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".parquet"):
+                objects.append({"key": obj["Key"], "size": obj["Size"], "last_modified": obj["LastModified"]})
+    return objects
+
+
+# folders of writes in progress (e.g. _temporary of spark) and other hidden folders are not part of the layer
+def is_hidden(prefix: str) -> bool:
+    return prefix.rstrip("/").rsplit("/", 1)[-1].startswith(("_", "."))
+
+
+# the "folders" directly below the prefix
+def list_prefixes(s3, bucket: str, prefix: str) -> list[str]:
+    prefixes = set()
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        prefixes.update(common_prefix["Prefix"] for common_prefix in page.get("CommonPrefixes", []))
+    return sorted(prefixes)
+
+
+# the dates of all bronze partitions
+def list_partitions(s3, bucket: str) -> list[str]:
+    return [partition_of(prefix) for prefix in list_prefixes(s3, bucket, f"{BRONZE_PREFIX}date=")]
+
+
+# manifest entry of a parquet object: rows and the min/max timestamp are taken from the footer (range request)
+def footer_entry(s3, bucket: str, key: str, size: int) -> dict:
+    tail = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{min(size, FOOTER_READ_BYTES)}")["Body"].read()
+    footer_length = struct.unpack("<I", tail[-8:-4])[0]
+    if footer_length + 8 > len(tail):
+        tail = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{footer_length + 8}")["Body"].read()
+    metadata = pq.read_metadata(BytesIO(b"PAR1" + tail[-(footer_length + 8):]))
+
+    entry = {"key": key, "size": size, "rows": metadata.num_rows, "min_timestamp": None, "max_timestamp": None}
+    if "timestamp" in metadata.schema.names:
+        column = metadata.schema.names.index("timestamp")
+        statistics = [metadata.row_group(i).column(column).statistics for i in range(metadata.num_row_groups)]
+        statistics = [s for s in statistics if s is not None and s.has_min_max]
+        if statistics:
+            entry["min_timestamp"] = str(min(s.min for s in statistics))
+            entry["max_timestamp"] = str(max(s.max for s in statistics))
+    return entry
+
+
+def empty_manifest(complete: bool = False) -> dict:
+    return {"version": 0, "complete": complete, "files": [], "removed": []}
+
+
+# returns the manifest and its ETag (None if the partition has no manifest yet)
+def read_manifest(s3, bucket: str, date: str):
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=partition_prefix(date) + MANIFEST_NAME)
+    except ClientError as err:
+        if err.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return empty_manifest(), None
+        raise
+    return json.loads(obj["Body"].read()), obj["ETag"]
+
+
+# replace the manifest if it was not changed since it was read (etag), otherwise ManifestConflict is raised
+def write_manifest(s3, bucket: str, date: str, manifest: dict, etag=None):
+    condition = {"IfMatch": etag} if etag is not None else {"IfNoneMatch": "*"}
+    manifest = {**manifest, "version": manifest["version"] + 1}
+    try:
+        s3.put_object(Bucket=bucket, Key=partition_prefix(date) + MANIFEST_NAME,
+                      Body=json.dumps(manifest).encode("utf-8"), ContentType="application/json", **condition)
+    except ClientError as err:
+        if err.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise ManifestConflict(f"manifest of partition {date} was changed concurrently") from err
+        raise
+    return manifest
+
+
+# the files of an earlier attempt of the micro-batch (a replayed batch is appended again): listed before the batch
+# is written, replaced in the manifest by register_batch and deleted afterwards (delete_keys) - the manifest never
+# lists a missing key
+def batch_keys(s3, bucket: str, date: str, batch_id: int) -> list[str]:
+    return [obj["Key"] for page in s3.get_paginator("list_objects_v2").paginate(
+        Bucket=bucket, Prefix=batch_prefix(date, batch_id)) for obj in page.get("Contents", [])]
+
+
+def delete_keys(s3, bucket: str, keys: list[str]) -> int:
+    for i in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]], "Quiet": True})
+    return len(keys)
+
+
+# register the files of a written micro-batch in the manifest of its partition (retried on concurrent changes,
+# e.g. by the compaction); the entries of an earlier attempt of the same batch are replaced, its files (superseded,
+# see batch_keys) are not registered again
+def register_batch(s3, bucket: str, date: str, batch_id: int, superseded: list[str] = (),
+                   retries: int = 5) -> list[dict]:
+    prefix = batch_prefix(date, batch_id)
+    superseded = set(superseded)
+    entries = [footer_entry(s3, bucket, obj["key"], obj["size"]) for obj in list_parquet_objects(s3, bucket, prefix)
+               if obj["key"] not in superseded]
+    for attempt in range(retries + 1):
+        manifest, etag = read_manifest(s3, bucket, date)
+        if etag is None:
+            # a new partition is complete from the start, an older one without manifest needs a repair
+            other_files = [obj for obj in list_parquet_objects(s3, bucket, partition_prefix(date))
+                           if not obj["key"].startswith(prefix)]
+            manifest = empty_manifest(complete=not other_files)
+        manifest["files"] = [entry for entry in manifest["files"] if not entry["key"].startswith(prefix)] + entries
+        try:
+            write_manifest(s3, bucket, date, manifest, etag)
+            return entries
+        except ManifestConflict:
+            if attempt == retries:
+                raise
+
+
+# the objects of a partition which are visible according to the manifest
+def visible_objects(objects: list[dict], manifest: dict) -> list[dict]:
+    removed = set(manifest["removed"])
+    registered = {entry["key"] for entry in manifest["files"]}
+    if manifest.get("complete"):
+        # unregistered objects are writes in progress or of failed attempts
+        return [obj for obj in objects if obj["key"] in registered and obj["key"] not in removed]
+    return [obj for obj in objects
+            if obj["key"] not in removed and (not is_compacted(obj["key"]) or obj["key"] in registered)]
+
+
+# the visible files of a partition (manifest entries): a complete manifest is used as it is,
+# otherwise the partition is listed - the manifest is read before and after the listing,
+# if a compaction switched the files in between, the partition is resolved again
+def visible_partition_entries(s3, bucket: str, date: str) -> list[dict]:
+    while True:
+        manifest, etag = read_manifest(s3, bucket, date)
+        if manifest.get("complete"):
+            return manifest["files"]
+        objects = list_parquet_objects(s3, bucket, partition_prefix(date))
+        if read_manifest(s3, bucket, date)[1] == etag:
+            entries = {entry["key"]: entry for entry in manifest["files"]}
+            return [entries.get(obj["key"], {"key": obj["key"], "size": obj["size"]})
+                    for obj in visible_objects(objects, manifest)]
+
+
+# all visible bronze files (manifest entries), only the partition folders are listed
+# (folders without a date= partition, e.g. of older ingests, are listed as they are)
+def visible_bronze_entries(s3, bucket: str) -> list[dict]:
+    entries = []
+    for prefix in list_prefixes(s3, bucket, BRONZE_PREFIX):
+        if is_hidden(prefix):
+            continue
+        date = partition_of(prefix)
+        if date is not None:
+            entries.extend(visible_partition_entries(s3, bucket, date))
+        else:
+            entries.extend({"key": obj["key"], "size": obj["size"]} for obj in list_parquet_objects(s3, bucket, prefix))
+    return entries
+
+
+def visible_bronze_files(s3, bucket: str) -> list[str]:
+    return [entry["key"] for entry in visible_bronze_entries(s3, bucket)]
+
+
+# rebuild the manifest of a partition from a (paginated) listing: every visible object is registered,
+# the statistics of known entries are kept, the footers of the others are read
+# NOTE: objects of failed, not yet replayed micro-batches become visible as well - repair while the ingest is stopped
+def repair_partition(s3, bucket: str, date: str, executor: ThreadPoolExecutor) -> dict:
+    manifest, etag = read_manifest(s3, bucket, date)
+    objects = list_parquet_objects(s3, bucket, partition_prefix(date))
+    known = {entry["key"]: entry for entry in manifest["files"]}
+    visible = visible_objects(objects, {**manifest, "complete": False})
+    entries = list(executor.map(lambda obj: known.get(obj["key"]) or footer_entry(s3, bucket, obj["key"], obj["size"]),
+                                visible))
+    listed = {obj["key"] for obj in objects}
+    repaired = {**manifest,
+                "complete": True,
+                "files": entries,
+                "removed": [key for key in manifest["removed"] if key in listed]}
+    return write_manifest(s3, bucket, date, repaired, etag)
+
+
+# repair the manifests of all (or the given) partitions, the partitions are listed in parallel
+def repair_manifests(s3, bucket: str, dates: list[str] = None, max_workers: int = 16) -> dict:
+    dates = dates or list_partitions(s3, bucket)
+    with ThreadPoolExecutor(max_workers) as executor, ThreadPoolExecutor(max_workers) as footer_executor:
+        manifests = executor.map(lambda date: repair_partition(s3, bucket, date, footer_executor), dates)
+        return {date: len(manifest["files"]) for date, manifest in zip(dates, manifests)}
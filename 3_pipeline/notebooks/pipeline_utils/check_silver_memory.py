@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pipeline_utils.benchmark import env_float, env_int, env_ints
+from pipeline_utils.classifiers import register_macros
+from pipeline_utils.sql import sql_string
+from pipeline_utils.incremental_silver import KEY_COLUMNS, partition_sql, stream_to_parquet, with_optional_columns
+
+# Memory ceiling check of the streaming silver transform: bronze histories of growing size are transformed
+# (1) the former way - every file read into pandas, concatenated, registered and fetched from DuckDB
+# (2) streaming - partition_sql/stream_to_parquet as used by incremental_silver
+# Every run is a fresh process, its peak RSS is reported. The check fails if the streaming peak of the largest
+# history grows by more than MAX_PEAK_GROWTH against the smallest one (the peak has to stay constant while the
+# history grows) or if a streaming run exceeds MEMORY_CEILING_MB (secondary guard).
+# The smallest history has to fill the DuckDB memory limit already, below that the buffer pool is still growing.
+#   cd 3_pipeline/notebooks && python -m pipeline_utils.check_silver_memory
+
+ROWS_PER_FILE = 100_000
+VALUE_COLUMNS = ["temperature", "humidity", "wind_speed", "temperature_category"]
+
+
+def transform_sql(source: str) -> str:
+    return f"""
+        SELECT location, timestamp, ingested_at, temperature, humidity, wind_speed,
+               temperature_category(temperature) AS temperature_category
+        FROM {source}
+    """
+
+
+def write_bronze(directory: str, files: int) -> list[str]:
+    paths = []
+    start = pd.Timestamp("2020-01-01", tz="UTC")
+    for i in range(files):
+        rng = np.random.default_rng(i)
+        timestamps = start + pd.to_timedelta(np.arange(i * ROWS_PER_FILE, (i + 1) * ROWS_PER_FILE), unit="s")
+        table = pa.table({
+            "timestamp": timestamps,
+            "temperature": rng.normal(10, 10, ROWS_PER_FILE),
+            "humidity": rng.uniform(20, 100, ROWS_PER_FILE),
+            "wind_speed": rng.gamma(2, 3, ROWS_PER_FILE),
+        })
+        path = os.path.join(directory, f"part-{i:05d}.parquet")
+        pq.write_table(table, path)
+        paths.append(path)
+    return paths
+
+
+def connect(memory_limit: str) -> duckdb.DuckDBPyConnection:
+    conn = duckdb.connect()
+    conn.execute(f"SET memory_limit = {sql_string(memory_limit)}")
+    conn.execute("SET TimeZone = 'UTC'")
+    conn.execute("SET enable_progress_bar = false")
+    return register_macros(conn)
+
+
+def run(mode: str, paths: list[str], batch_size: int, memory_limit: str, queue):
+    # the connection (and its threads) is closed before the worker process exits
+    with connect(memory_limit) as conn, tempfile.TemporaryFile() as sink:
+        if mode == "pandas":
+            df_combined = pd.concat([pd.read_parquet(path) for path in paths])
+            conn.register("weather_data", df_combined)
+            df_transformed = conn.execute(transform_sql(with_optional_columns(conn, "weather_data"))).fetchdf()
+            df_transformed.to_parquet(sink, engine="pyarrow", index=False)
+            rows = len(df_transformed)
+        else:
+            source = with_optional_columns(conn, f"read_parquet([{', '.join(sql_string(path) for path in paths)}])")
+            sql = partition_sql(transform_sql(source), None, list(KEY_COLUMNS), VALUE_COLUMNS)
+            rows, _, _ = stream_to_parquet(conn, sql, sink, batch_size)
+    # ru_maxrss is in KB on linux
+    queue.put((rows, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def measure(context, mode: str, paths: list[str], batch_size: int, memory_limit: str):
+    queue = context.Queue()
+    process = context.Process(target=run, args=(mode, paths, batch_size, memory_limit, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    histories = env_ints("HISTORY_FILES", "20,40,80")
+    batch_size = env_int("SILVER_BATCH_SIZE", 100000)
+    memory_limit = os.getenv("DUCKDB_MEMORY_LIMIT", "256MB")
+    max_growth = env_float("MAX_PEAK_GROWTH", 1.2)
+    ceiling_mb = env_float("MEMORY_CEILING_MB", 768)
+
+    context = multiprocessing.get_context("spawn")
+    streaming_peaks = {}
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_bronze(directory, max(histories))
+        print(f"batch size {batch_size}, DuckDB memory limit {memory_limit}, ceiling {ceiling_mb:.0f} MB")
+        for files in histories:
+            for mode in ("pandas", "streaming"):
+                rows, peak_mb = measure(context, mode, paths[:files], batch_size, memory_limit)
+                print(f"{files * ROWS_PER_FILE:12,d} bronze rows  {mode:10s} peak RSS {peak_mb:8.0f} MB  "
+                      f"({rows:,} silver rows)")
+                if mode == "streaming":
+                    streaming_peaks[files] = peak_mb
+    smallest, largest = min(streaming_peaks), max(streaming_peaks)
+    growth = streaming_peaks[largest] / streaming_peaks[smallest]
+    print(f"streaming peak growth {smallest * ROWS_PER_FILE:,} -> {largest * ROWS_PER_FILE:,} bronze rows: "
+          f"{growth:.2f}x (max. {max_growth:.2f}x)")
+    failed = False
+    if growth > max_growth:
+        print(f"Streaming peak grows with the history by {growth:.2f}x")
+        failed = True
+    if max(streaming_peaks.values()) > ceiling_mb:
+        print(f"Memory ceiling of {ceiling_mb:.0f} MB exceeded")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("Streaming transform stayed bounded and below the memory ceiling")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from pipeline_utils.sql import sql_string
+
+# Classifications of the silver layers, shared by the batch and the streaming pipeline.
+# Every classification exists as a vectorized pandas function (np.select/pd.cut, a whole column at once instead of
+# a python call per row) and as an equivalent DuckDB macro (register_macros), both are built from the same bins.
+# The results are categoricals (one small code per row). As in the former row-wise functions, values which fall
+# into no bin (missing values) get the last category, e.g. "Warm", "Storm" or "Autumn".
+
+SEASONS = {
+    "Winter": (12, 1, 2),
+    "Spring": (3, 4, 5),
+    "Summer": (6, 7, 8),
+    "Autumn": (9, 10, 11),
+}
+
+# (exclusive upper bound, category), the last category has no upper bound
+TEMPERATURE_BINS = [(0, "Freezing"), (10, "Cold"), (20, "Mild"), (None, "Warm")]
+# simplified Beaufort scale (m/s)
+WIND_BINS = [(1, "Calm"), (5, "Light Breeze"), (11, "Breeze"), (19, "Windy"), (None, "Storm")]
+
+
+# lookups of the retail ids (batch silver notebook), further stores/products are added here
+PRODUCT_LOOKUP = {1: "Organic Apples", 2: "Bananas", 3: "Bread", 4: "Milk", 5: "Beer", 6: "Juice", 7: "Yogurt",
+                  8: "Chocolate", 9: "Coffee", 10: "Tea"}
+STORE_LOOKUP = {1: "Vienna Center", 2: "Linz Mall", 3: "Salzburg City", 4: "Graz Hauptplatz", 5: "Innsbruck Center"}
+
+
+# columns with few distinct values: pandas categoricals, dictionary columns in parquet/arrow (the strings are stored
+# once, a row holds a small integer code - filtering and grouping compare codes instead of strings)
+CATEGORICAL_COLUMNS = ("season", "temperature_category", "wind_category", "store_name", "product_name")
+CATEGORIES = {
+    "season": list(SEASONS),
+    "temperature_category": [label for _, label in TEMPERATURE_BINS],
+    "wind_category": [label for _, label in WIND_BINS],
+}
+
+
+# the categorical columns of the frame (also with the suffixes of a merge, e.g. season_x) as categoricals, e.g.
+# before writing a table or after a DuckDB query (which returns strings); known categories keep their order
+def categorize(df: pd.DataFrame, columns=CATEGORICAL_COLUMNS) -> pd.DataFrame:
+    for column in df.columns:
+        name = column[:-2] if column.endswith(("_x", "_y")) else column
+        if name not in columns or isinstance(df[column].dtype, pd.CategoricalDtype):
+            continue
+        known = CATEGORIES.get(name, [])
+        extra = sorted(set(df[column].dropna().unique()) - set(known))
+        df[column] = pd.Categorical(df[column], categories=known + extra)
+    return df
+
+
+def season(month: pd.Series) -> pd.Series:
+    names = list(SEASONS)
+    # code of every month (index 1-12), other/missing months get the last season
+    lookup = np.full(13, len(names) - 1, dtype=np.int8)
+    for code, months in enumerate(SEASONS.values()):
+        lookup[list(months)] = code
+    values = month.to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = np.isin(values, np.arange(1, 13))
+    codes = np.full(len(values), len(names) - 1, dtype=np.int8)
+    codes[valid] = lookup[values[valid].astype(np.int8)]
+    return pd.Series(pd.Categorical.from_codes(codes, names), index=month.index, name="season")
+
+
+def classify(values: pd.Series, bins: list[tuple]) -> pd.Series:
+    edges = [-np.inf] + [bound for bound, _ in bins[:-1]] + [np.inf]
+    return pd.cut(values, edges, right=False, labels=[label for _, label in bins]).fillna(bins[-1][1])
+
+
+def temperature_category(temperature: pd.Series) -> pd.Series:
+    return classify(temperature, TEMPERATURE_BINS).rename("temperature_category")
+
+
+def wind_category(wind_speed: pd.Series) -> pd.Series:
+    return classify(wind_speed, WIND_BINS).rename("wind_category")
+
+
+def case_sql(column: str, bins: list[tuple]) -> str:
+    whens = [f"WHEN {column} < {bound} THEN {sql_string(label)}" for bound, label in bins[:-1]]
+    return "CASE " + " ".join(whens) + f" ELSE {sql_string(bins[-1][1])} END"
+
+
+def season_sql(column: str) -> str:
+    whens = [f"WHEN {column} IN ({', '.join(map(str, months))}) THEN {sql_string(name)}"
+             for name, months in list(SEASONS.items())[:-1]]
+    return "CASE " + " ".join(whens) + f" ELSE {sql_string(list(SEASONS)[-1])} END"
+
+
+# the classifications as macros of the connection: season(month), temperature_category(t), wind_category(speed)
+def register_macros(conn):
+    conn.execute(f"CREATE OR REPLACE MACRO season(month) AS {season_sql('month')}")
+    conn.execute(f"CREATE OR REPLACE MACRO temperature_category(t) AS {case_sql('t', TEMPERATURE_BINS)}")
+    conn.execute(f"CREATE OR REPLACE MACRO wind_category(speed) AS {case_sql('speed', WIND_BINS)}")
+    return conn
@@ -0,0 +1,101 @@
+from urllib.parse import urlparse
+
+import duckdb
+
+from pipeline_utils.classifiers import register_macros
+from pipeline_utils.sql import sql_string
+from pipeline_utils.table_log import FILTER_OPS, Table, matches
+
+# Shared DuckDB connection of the notebooks: parquet files are queried directly in MinIO (httpfs extension, S3 API)
+# instead of being downloaded with boto3, parsed with pandas and registered as DataFrames. DuckDB only fetches the
+# columns and row groups a query needs (range requests; filters are checked against the row group statistics)
+# and streams them through the query - the memory is bounded by memory_limit, not by the size of the data.
+# The files of a table are taken from its log (table_scan), a glob (s3://bucket/prefix/*.parquet) works as well
+# but lists the prefix and ignores the table versions. With filters only the partitions which can match are
+# scanned (pruned with the partition values of the log), the filters are applied to the rows as well. The partition
+# columns are read from the files (in the types they were written with), never from the year=.../ paths.
+
+
+# connection configured for the (local) S3 endpoint, e.g. connect("http://minio:9000", "admin", "password")
+# the classifications of pipeline_utils.classifiers are available as macros
+def connect(endpoint: str, access_key: str, secret_key: str, memory_limit: str = "2GB", threads: int = None,
+            database: str = ":memory:") -> duckdb.DuckDBPyConnection:
+    url = urlparse(endpoint if "://" in endpoint else f"http://{endpoint}")
+    conn = duckdb.connect(database=database)
+    # the container image ships the extension, INSTALL is a no-op then
+    conn.execute("INSTALL httpfs")
+    conn.execute("LOAD httpfs")
+    conn.execute(f"""
+        CREATE OR REPLACE SECRET minio (
+            TYPE S3,
+            KEY_ID {sql_string(access_key)},
+            SECRET {sql_string(secret_key)},
+            ENDPOINT {sql_string(url.netloc)},
+            URL_STYLE 'path',
+            USE_SSL {str(url.scheme == "https").lower()},
+            REGION 'us-east-1'
+        )
+    """)
+    conn.execute(f"SET memory_limit = {sql_string(memory_limit)}")
+    if threads is not None:
+        conn.execute(f"SET threads = {int(threads)}")
+    # timestamps of the parquet files are UTC, DataFrames get UTC instead of the local time zone
+    conn.execute("SET TimeZone = 'UTC'")
+    return register_macros(conn)
+
+
+def s3_url(bucket: str, key: str) -> str:
+    return f"s3://{bucket}/{key}"
+
+
+# read_parquet over the given objects, usable as a table in the FROM clause
+# hive partitioning is off: DuckDB would add the columns of the path (date=.../, year=.../), the columns are the ones
+# of the files
+def parquet_scan(bucket: str, keys: list[str]) -> str:
+    if not keys:
+        raise ValueError("No parquet files to scan")
+    files = ", ".join(sql_string(s3_url(bucket, key)) for key in keys)
+    return f"read_parquet([{files}], union_by_name = true, hive_partitioning = false)"
+
+
+def sql_literal(value) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return str(value).upper()
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return sql_string(str(value))
+
+
+# the filter predicates (column, op, value) of table_log as a WHERE condition
+def filter_sql(filters) -> str:
+    conditions = []
+    for column, op, value in filters:
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unknown filter operator {op!r}")
+        if op in ("in", "not in"):
+            conditions.append(f'"{column}" {op.upper()} ({", ".join(sql_literal(item) for item in value) or "NULL"})')
+        else:
+            conditions.append(f'"{column}" {"=" if op == "==" else op} {sql_literal(value)}')
+    return " AND ".join(conditions) or "true"
+
+
+# the files of a table version (default: latest), e.g. conn.sql(f"SELECT ... FROM {table_scan(table)}")
+# filters, e.g. [("year", ">=", 2023)]: only the matching partitions are read, the rows are filtered
+def table_scan(table: Table, version: int = None, as_of=None, filters=None) -> str:
+    snapshot = table.snapshot(version, as_of)
+    if not snapshot["files"]:
+        raise ValueError(f"Table {table.prefix} has no data files")
+    if not filters:
+        return parquet_scan(table.bucket, [entry["key"] for entry in snapshot["files"]])
+    # if every partition is pruned one file is scanned for the schema, the filters remove its rows
+    keys = [entry["key"] for entry in snapshot["files"] if matches(entry, filters)] or [snapshot["files"][0]["key"]]
+    return f"(SELECT * FROM {parquet_scan(table.bucket, keys)} WHERE {filter_sql(filters)})"
+
+
+# the version of the table as a view of the connection (the file list is resolved once, when the view is created)
+def create_table_view(conn: duckdb.DuckDBPyConnection, name: str, table: Table, version: int = None,
+                      as_of=None, filters=None) -> str:
+    conn.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM {table_scan(table, version, as_of, filters)}")
+    return name
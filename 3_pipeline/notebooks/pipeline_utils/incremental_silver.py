@@ -0,0 +1,286 @@
+import datetime
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from pipeline_utils.bronze_manifest import partition_of, visible_bronze_entries
+from pipeline_utils.duckdb_s3 import parquet_scan
+from pipeline_utils.key_index import changes_sql, index_entries, remaining_sql, updated_index_sql, write_index
+from pipeline_utils.sql import sql_string
+from pipeline_utils.table_log import Table
+
+# Incremental silver processing: only bronze files which were not processed yet are read and transformed.
+# The silver table is partitioned by event date (data/date=YYYY-MM-DD/), its commits carry the state:
+#   "processed":  the bronze files which are part of the silver table
+#   "watermarks": per partition the latest event time in silver
+#   "indexes":    per partition the key index (pipeline_utils.key_index)
+# The state is committed together with the data - a failed run leaves no trace, the next one processes the same
+# files again. Files created by the bronze compaction ("compacted_from") are skipped if their sources were
+# processed already.
+#
+# Deduplication: the producer re-sends overlapping forecast windows, silver keeps one record per key (location,
+# timestamp). Within a run the record with the latest version wins (the Kafka time of the message, ingested_at);
+# against the silver table the policy decides (latest_forecast or last_write, see key_index). The new records of a
+# partition are checked against its key index only - the silver files are not scanned, except the few files which
+# hold a replaced record (they are rewritten). Partitions without an index (written before the index existed) are
+# merged once: the partition is rewritten with the duplicates removed and gets its index.
+#
+# Bounded memory: transform_sql(source) returns the SELECT of the silver records from the source (a read_parquet
+# over the new bronze files of a date). DuckDB runs it directly on the files in MinIO (duckdb_s3), the result is
+# fetched in record batches of batch_size rows and written with a ParquetWriter (a row group per batch) to a
+# temporary file - neither the bronze nor the silver data of a run is held in memory as a whole, deduplication and
+# sorting are done by DuckDB (spills to disk above its memory_limit). Only the key index entries of the written
+# records are kept in memory.
+
+PARTITION_COLUMN = "timestamp"
+ORDER_COLUMN = "ingested_at"
+KEY_COLUMNS = ("location", "timestamp")
+# older bronze files (and the silver files written from them) have no location/ingestion time
+OPTIONAL_COLUMNS = {"location": "VARCHAR", ORDER_COLUMN: "TIMESTAMPTZ"}
+POLICY = "latest_forecast"
+# rows per record batch/row group of the written silver files
+BATCH_SIZE = 100_000
+
+
+def partition_name(date: str) -> str:
+    return f"date={date}"
+
+
+# the bronze entries which are not part of the silver table yet (compacted files of processed sources are
+# added to the processed files instead)
+def unprocessed_entries(entries: list[dict], processed: set) -> list[dict]:
+    for entry in entries:
+        sources = entry.get("compacted_from")
+        if sources and processed.issuperset(sources):
+            processed.add(entry["key"])
+    return [entry for entry in entries if entry["key"] not in processed]
+
+
+# the source with the optional columns in their types, missing ones added as NULL (a file whose location is always
+# empty has no string column)
+def with_optional_columns(conn, source: str) -> str:
+    present = {row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+    casts = [f"CAST({column} AS {kind}) AS {column}" for column, kind in OPTIONAL_COLUMNS.items() if column in present]
+    missing = [f"CAST(NULL AS {kind}) AS {column}" for column, kind in OPTIONAL_COLUMNS.items()
+               if column not in present]
+    replace = f" REPLACE ({', '.join(casts)})" if casts else ""
+    return f"(SELECT *{replace}{''.join(', ' + column for column in missing)} FROM {source})"
+
+
+def columns_of(conn, sql: str) -> list[str]:
+    return [row[0] for row in conn.execute(f"DESCRIBE {sql}").fetchall()]
+
+
+# the records written to a partition may only have the silver columns (a merge must not add a column, e.g. one
+# taken from the path of the file); columns starting with "_" are not written
+def check_columns(conn, sql: str, silver_columns: list[str]):
+    extra = [column for column in columns_of(conn, sql) if not column.startswith("_") and column not in silver_columns]
+    if extra:
+        raise ValueError(f"Silver records with unexpected columns {extra} (silver columns: {silver_columns}), "
+                         "a changed transformation needs a full_rebuild")
+
+
+# the new records of the partition (date: only the records of that date)
+def new_records_sql(new_source: str, date: str = None) -> str:
+    # ingests before the partitioned bronze layer stored the timestamp as a string
+    new = f"SELECT * REPLACE (CAST({PARTITION_COLUMN} AS TIMESTAMPTZ) AS {PARTITION_COLUMN}) FROM ({new_source})"
+    if date is not None:
+        new = f"SELECT * FROM ({new}) WHERE CAST({PARTITION_COLUMN} AS DATE) = DATE {sql_string(date)}"
+    return new
+
+
+# the silver records of a partition: the new records, merged with the existing records of the partition if given,
+# one record per key (chosen by the policy), sorted by time. Besides the silver columns the records have a _version
+# (ingestion time in microseconds, 0 if unknown) and a _row_hash of the value columns for the key index.
+def partition_sql(new_source: str, existing_source: str, key_columns: list[str], value_columns: list[str],
+                  date: str = None, policy: str = POLICY) -> str:
+    new = new_records_sql(new_source, date)
+    version = f"epoch_us(coalesce({ORDER_COLUMN}, TIMESTAMPTZ '1970-01-01 00:00:00+00'))"
+    records = f"SELECT *, {version} AS _version, 1 AS _new FROM ({new})"
+    if existing_source is not None:
+        records = f"SELECT *, {version} AS _version, 0 AS _new FROM {existing_source} UNION ALL BY NAME {records}"
+    # one sortable number: latest_forecast prefers the latest version (the new record on a tie), last_write the
+    # new record (the latest version among the new ones)
+    if policy == "latest_forecast":
+        priority = "_version * 2 + _new"
+    else:
+        priority = "_new * (CAST(1 AS BIGINT) << 62) + _version"
+    keys = ", ".join(key_columns)
+    # a grouped aggregate instead of a window function: DuckDB can spill it to disk
+    return f"""
+        SELECT *, hash({", ".join(value_columns) or "NULL"}) AS _row_hash
+        FROM (
+            SELECT {keys}, arg_max_null(COLUMNS(* EXCLUDE ({keys}, _new, _priority)), _priority)
+            FROM (SELECT *, {priority} AS _priority FROM ({records}))
+            GROUP BY {keys}
+        )
+        ORDER BY {PARTITION_COLUMN}
+    """
+
+
+# write the result of the query to the sink as parquet, batch by batch (columns starting with "_" are not written).
+# Returns the rows, the latest event time and the index_columns of the written records (None without index_columns)
+def stream_to_parquet(conn, sql: str, sink, batch_size: int = BATCH_SIZE, index_columns: list[str] = None):
+    reader = conn.execute(sql).fetch_record_batch(batch_size)
+    columns = [name for name in reader.schema.names if not name.startswith("_")]
+    schema = pa.schema([reader.schema.field(name) for name in columns])
+    rows, latest, index = 0, None, []
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in reader:
+            if batch.num_rows == 0:
+                continue
+            writer.write_batch(batch.select(columns), row_group_size=batch_size)
+            if index_columns:
+                index.append(batch.select(index_columns))
+            rows += batch.num_rows
+            batch_latest = pc.max(batch.column(PARTITION_COLUMN)).as_py()
+            latest = batch_latest if latest is None else max(latest, batch_latest)
+    if not index_columns:
+        return rows, latest, None
+    return rows, latest, pa.Table.from_batches(index, pa.schema([reader.schema.field(name) for name in index_columns]))
+
+
+# the event dates of bronze files outside of a date partition (older ingests)
+def event_dates(conn, bucket: str, keys: list[str]) -> set:
+    if not keys:
+        return set()
+    rows = conn.execute(f"""
+        SELECT DISTINCT strftime(CAST(CAST({PARTITION_COLUMN} AS TIMESTAMPTZ) AS DATE), '%Y-%m-%d')
+        FROM {parquet_scan(bucket, keys)}
+    """).fetchall()
+    return {row[0] for row in rows if row[0] is not None}
+
+
+# write the records of the query as a new data file of the partition; returns its entry (None: no records), the
+# latest event time and the key index entries of the file
+def write_partition_file(conn, table: Table, sql: str, partition: str, key_columns: list[str], batch_size: int):
+    with tempfile.TemporaryFile() as sink:
+        rows, latest, records = stream_to_parquet(conn, sql, sink, batch_size, key_columns + ["_version", "_row_hash"])
+        if rows == 0:
+            return None, None, None
+        entry = table.upload_file(sink, rows, partition)
+    return entry, latest, index_entries(records, key_columns, entry["key"])
+
+
+def upload_index(conn, table: Table, sql: str, partition: str) -> str:
+    with tempfile.TemporaryFile() as sink:
+        write_index(conn.execute(sql).fetch_arrow_table(), sink)
+        return table.upload_index(sink, partition)
+
+
+# transform the bronze files into the silver table; full_rebuild (backfills, changed transformation) processes
+# every bronze file and replaces the whole table. Returns a summary of the run ("duplicates": the records removed by
+# the deduplication - dropped new records and replaced silver records).
+def process_silver(s3, conn, bucket: str, table: Table, transform_sql, full_rebuild: bool = False,
+                   key_columns: list[str] = KEY_COLUMNS, batch_size: int = BATCH_SIZE, policy: str = POLICY) -> dict:
+    key_columns = list(key_columns)
+    snapshot = table.snapshot()
+    metadata = {} if full_rebuild else snapshot.get("metadata", {})
+    processed = set(metadata.get("processed", []))
+    watermarks = dict(metadata.get("watermarks", {}))
+    indexes = dict(metadata.get("indexes", {}))
+
+    entries = visible_bronze_entries(s3, bucket)
+    new_entries = unprocessed_entries(entries, processed)
+    summary = {"version": snapshot["version"], "bronze_files": len(new_entries), "rows": 0, "duplicates": 0,
+               "appended": 0, "merged": 0, "rewritten_files": 0, "full_rebuild": full_rebuild}
+    if not new_entries and not full_rebuild:
+        return summary
+
+    by_date = {}
+    for entry in new_entries:
+        by_date.setdefault(partition_of(entry["key"]), []).append(entry)
+    # files outside of a date partition are filtered by date and read for every date they contain
+    legacy = [entry["key"] for entry in by_date.pop(None, [])]
+
+    added, removed = [], []
+    for date in sorted(set(by_date) | event_dates(conn, bucket, legacy)):
+        partition = partition_name(date)
+        keys = [entry["key"] for entry in by_date.get(date, [])] + legacy
+        existing_entries = [] if full_rebuild else [entry for entry in snapshot["files"]
+                                                    if entry.get("partition") == partition]
+        existing = [entry["key"] for entry in existing_entries]
+        index_key = indexes.get(date) if existing else None
+        new_source = transform_sql(with_optional_columns(conn, parquet_scan(bucket, keys)))
+        silver_columns = columns_of(conn, new_source)
+        value_columns = [column for column in silver_columns if column not in key_columns and column != ORDER_COLUMN]
+
+        new_rows = conn.execute(f"SELECT count(*) FROM ({new_records_sql(new_source, date if legacy else None)})"
+                                ).fetchone()[0]
+        if index_key is None:
+            # new partition, or a partition without index: merged with its existing records
+            merge = bool(existing)
+            existing_source = with_optional_columns(conn, parquet_scan(bucket, existing)) if merge else None
+            sql = partition_sql(new_source, existing_source, key_columns, value_columns, date if legacy else None,
+                                policy)
+            check_columns(conn, sql, silver_columns)
+            entry, latest, index = write_partition_file(conn, table, sql, partition, key_columns, batch_size)
+            if entry is None:
+                continue
+            # the records removed by the merge: duplicates within the new records and the existing ones (an existing
+            # partition may hold duplicates of its own) and the existing records replaced by new ones
+            summary["duplicates"] += new_rows + sum(existing_entry["rows"] for existing_entry in existing_entries) \
+                - entry["rows"]
+            added.append(entry)
+            if merge:
+                removed += existing
+            conn.register("silver_index_added", index)
+            indexes[date] = upload_index(conn, table, "SELECT * FROM silver_index_added ORDER BY "
+                                         + ", ".join(key_columns), partition)
+        else:
+            # only the new records which change the partition are written, the files of replaced records rewritten
+            new_sql = partition_sql(new_source, None, key_columns, value_columns, date if legacy else None, policy)
+            index_source = parquet_scan(bucket, [index_key])
+            conn.execute(f"CREATE OR REPLACE TEMP TABLE silver_new AS {new_sql}")
+            conn.execute("CREATE OR REPLACE TEMP TABLE silver_changes AS "
+                         + changes_sql("silver_new", index_source, key_columns, policy))
+            # the records removed: the new records which do not change the partition and the replaced records
+            changes, replacements = conn.execute(
+                "SELECT count(*), count(_replaced_file) FROM silver_changes").fetchone()
+            summary["duplicates"] += new_rows - changes + replacements
+            entry, latest, index = write_partition_file(
+                conn, table, f"SELECT * FROM silver_changes ORDER BY {PARTITION_COLUMN}", partition, key_columns,
+                batch_size)
+            if entry is None:
+                continue
+            added.append(entry)
+            rewritten = {}
+            replaced = [row[0] for row in conn.execute(
+                "SELECT DISTINCT _replaced_file FROM silver_changes WHERE _replaced_file IS NOT NULL").fetchall()]
+            for key in replaced:
+                remaining = remaining_sql(bucket, key, "silver_changes", key_columns, PARTITION_COLUMN)
+                check_columns(conn, remaining, silver_columns)
+                with tempfile.TemporaryFile() as sink:
+                    rows, _, _ = stream_to_parquet(conn, remaining, sink, batch_size)
+                    if rows > 0:
+                        rewritten[key] = table.upload_file(sink, rows, partition)
+                removed.append(key)
+            added += rewritten.values()
+            summary["rewritten_files"] += len(replaced)
+            merge = bool(replaced)
+            conn.register("silver_index_added", index)
+            moved = {key: rewritten_entry["key"] for key, rewritten_entry in rewritten.items()}
+            indexes[date] = upload_index(conn, table, updated_index_sql(index_source, "silver_changes", moved,
+                                                                        "silver_index_added", key_columns), partition)
+        conn.unregister("silver_index_added")
+
+        summary["merged" if merge else "appended"] += 1
+        summary["rows"] += entry["rows"]
+        if watermarks.get(date) is None or pd.Timestamp(latest) > pd.Timestamp(watermarks[date]):
+            watermarks[date] = latest.isoformat()
+
+    conn.execute("DROP TABLE IF EXISTS silver_new")
+    conn.execute("DROP TABLE IF EXISTS silver_changes")
+    # only the currently visible bronze files are tracked (the state does not grow with compacted files)
+    visible = {entry["key"] for entry in entries}
+    processed = sorted((processed | {entry["key"] for entry in new_entries}) & visible)
+    committed = table.commit(add=added, remove=removed, replace_all=full_rebuild,
+                             operation="full_rebuild" if full_rebuild else "incremental",
+                             metadata={"processed": processed, "watermarks": watermarks, "indexes": indexes,
+                                       "processed_at": datetime.datetime.now(datetime.timezone.utc).isoformat()},
+                             base_version=snapshot["version"])
+    summary["version"] = committed["version"]
+    return summary
@@ -0,0 +1,82 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pipeline_utils.duckdb_s3 import parquet_scan
+from pipeline_utils.sql import sql_string
+
+# Persistent key index of a silver partition: a small parquet file with one row per silver record, sorted by key
+#   <key columns (location, timestamp)> | version | row_hash | file
+# version orders the records of a key (the time the forecast was published), row_hash is a hash of the values and
+# file the data file which holds the record. The new records of a partition are deduplicated against its index
+# instead of the silver files: unknown keys are inserted, a known key is only written again if its values changed
+# (and, with the latest_forecast policy, its version is not older). The superseded records are removed by
+# rewriting the data files which hold one of them - re-sent overlapping forecast windows mostly repeat unchanged
+# values and are dropped without touching a data file.
+# The index files are immutable like the data files and referenced by the commit ("indexes" of the metadata),
+# index and data always belong to the same table version.
+# The row hash is computed by DuckDB (hash()), it may change with a DuckDB upgrade: unchanged records then look
+# changed once and are rewritten, the result stays correct.
+
+# latest_forecast: the record with the latest version wins, a replayed older forecast is dropped
+# last_write: the record of the latest run wins, the version only decides between the records of one run
+POLICIES = ("latest_forecast", "last_write")
+
+
+def key_condition(left: str, right: str, key_columns: list[str]) -> str:
+    # NULL keys (records without a location) are equal to each other
+    return " AND ".join(f"{left}.{column} IS NOT DISTINCT FROM {right}.{column}" for column in key_columns)
+
+
+# the new records which change the partition: unknown keys and changed values, with the file of the replaced record
+def changes_sql(new_source: str, index_source: str, key_columns: list[str], policy: str) -> str:
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown deduplication policy {policy!r}, expected one of {POLICIES}")
+    changed = "n._row_hash <> i.row_hash"
+    if policy == "latest_forecast":
+        changed += " AND n._version >= i.version"
+    return f"""
+        SELECT n.*, i.file AS _replaced_file
+        FROM {new_source} n LEFT JOIN {index_source} i ON {key_condition("n", "i", key_columns)}
+        WHERE i.file IS NULL OR ({changed})
+    """
+
+
+# the records of a data file without the ones replaced by the changes
+def remaining_sql(bucket: str, key: str, changes: str, key_columns: list[str], order_column: str) -> str:
+    return f"""
+        SELECT f.*
+        FROM {parquet_scan(bucket, [key])} f ANTI JOIN {changes} c ON {key_condition("f", "c", key_columns)}
+        ORDER BY f.{order_column}
+    """
+
+
+# the index after the changes: the entries which were not replaced (moved to the rewritten files) and the entries of
+# the added records (added_source: key columns, version, row_hash, file)
+def updated_index_sql(index_source: str, changes: str, rewritten: dict, added_source: str,
+                      key_columns: list[str]) -> str:
+    keys = ", ".join(key_columns)
+    file = "i.file"
+    if rewritten:
+        cases = " ".join(f"WHEN {sql_string(old)} THEN {sql_string(new)}" for old, new in rewritten.items())
+        file = f"CASE i.file {cases} ELSE i.file END"
+    return f"""
+        SELECT * FROM (
+            SELECT i.* REPLACE ({file} AS file)
+            FROM {index_source} i ANTI JOIN {changes} c ON {key_condition("i", "c", key_columns)}
+            UNION ALL BY NAME
+            SELECT {keys}, version, row_hash, file FROM {added_source}
+        )
+        ORDER BY {keys}
+    """
+
+
+# the index entries of a written data file (records: its key columns, _version and _row_hash)
+def index_entries(records: pa.Table, key_columns: list[str], file: str) -> pa.Table:
+    table = records.select(list(key_columns) + ["_version", "_row_hash"])
+    table = table.rename_columns(list(key_columns) + ["version", "row_hash"])
+    return table.append_column("file", pa.array([file] * table.num_rows, type=pa.string()))
+
+
+def write_index(table: pa.Table, sink):
+    # the file names repeat for many keys: dictionary encoded
+    pq.write_table(table, sink, use_dictionary=["file"], compression="zstd")
@@ -0,0 +1,77 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+
+import boto3
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.config import Config
+
+# Parallel download of many (small) objects: a request to MinIO/S3 mostly waits for the first byte, fetching the
+# objects one after another adds up this latency per file. The objects are fetched by a bounded thread pool with
+# a shared boto3 client (thread safe, its connection pool is sized to the threads - the default pool of 10
+# connections would make the other threads wait). At most prefetch objects are in flight or waiting to be
+# consumed, the memory does not grow with the number of keys.
+
+MAX_WORKERS = 16
+
+
+# a client whose connection pool serves max_workers threads, e.g. pooled_client(endpoint_url=..., ...)
+def pooled_client(max_workers: int = MAX_WORKERS, **client_kwargs):
+    return boto3.client("s3", config=Config(max_pool_connections=max_workers), **client_kwargs)
+
+
+# the parsers run on the download threads: no nested arrow threads (use_threads) and no asynchronous read-ahead on
+# arrow's IO pool (pre_buffer) - the body is in memory already, and read-ahead tasks still running when the process
+# exits (e.g. after a stopped fetch) abort it ("terminate called without an active exception")
+def parquet_table(body: bytes) -> pa.Table:
+    return pq.read_table(BytesIO(body), use_threads=False, pre_buffer=False)
+
+
+def parquet_frame(body: bytes) -> pd.DataFrame:
+    return pd.read_parquet(BytesIO(body), use_threads=False, pre_buffer=False)
+
+
+# yields (key, parse(body)) for every key; ordered: in the order of the keys, otherwise as the downloads complete
+def fetch_objects(s3, bucket: str, keys, parse=parquet_table, max_workers: int = MAX_WORKERS, ordered: bool = True,
+                  prefetch: int = None):
+    prefetch = prefetch or 2 * max_workers
+    keys = iter(keys)
+
+    def fetch(key):
+        return key, parse(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+    executor = ThreadPoolExecutor(max_workers, thread_name_prefix="s3-fetch")
+    try:
+        pending = deque() if ordered else set()
+        submit = pending.append if ordered else pending.add
+        for key in keys:
+            submit(executor.submit(fetch, key))
+            if len(pending) >= prefetch:
+                break
+
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, pending_left = wait(pending, return_when=FIRST_COMPLETED)
+                pending.intersection_update(pending_left)
+            for future in done:
+                key = next(keys, None)
+                if key is not None:
+                    submit(executor.submit(fetch, key))
+                yield future.result()
+    finally:
+        # stopped early (or failed): the queued downloads are dropped
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# the parquet objects as one table (in the order of the keys), optionally filtered (pyarrow filter predicates)
+def fetch_table(s3, bucket: str, keys: list[str], columns: list[str] = None, filters=None,
+                max_workers: int = MAX_WORKERS) -> pa.Table:
+    def parse(body):
+        return pq.read_table(BytesIO(body), columns=columns, filters=filters, use_threads=False, pre_buffer=False)
+
+    tables = [table for _, table in fetch_objects(s3, bucket, keys, parse, max_workers=max_workers)]
+    return pa.concat_tables(tables, promote_options="permissive")
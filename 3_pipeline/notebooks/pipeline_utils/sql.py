@@ -0,0 +1,5 @@
+# SQL literals for the DuckDB queries of the pipeline (shared by classifiers, duckdb_s3 and the other helpers)
+
+
+def sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
@@ -0,0 +1,288 @@
+import datetime
+import json
+import operator
+import time
+import uuid
+from io import BytesIO
+from urllib.parse import quote
+
+import pandas as pd
+from botocore.exceptions import ClientError
+
+from pipeline_utils.parallel_fetch import fetch_table
+
+# Lightweight table format over MinIO (a small subset of what Delta Lake/Iceberg do):
+#   <table>/data/<id>.parquet         immutable data files, never overwritten
+#   <table>/_log/<version>.json       one object per commit with the complete file list of the snapshot
+#   <table>/_log/_latest.json         hint to the latest version (readers check whether a newer version exists)
+# A commit is a conditional PUT (If-None-Match: *) of the next version - two writers can never create the same
+# version, the loser retries on top of the new snapshot. Several files are added/removed in a single commit.
+# Readers resolve the files of a snapshot from a single small log object: they never see a half written table,
+# and older versions stay readable (time travel) until they are vacuumed.
+#
+#   {"version": 3, "timestamp": "...", "operation": "overwrite", "added": [...], "removed": [...],
+#    "files": [{"key": "silver/weather/data/<id>.parquet", "size": 123, "rows": 10}, ...],
+#    "metadata": {...}}
+# metadata: state of the writer (e.g. the processed input files), committed atomically with the data and carried
+# over to the next version unless a commit replaces it.
+# Files of partitioned tables are written to <table>/data/<partition>/ (e.g. date=2025-06-01) and have a "partition".
+# Tables written with partition_by (hive style, e.g. data/year=2024/month=3/) also have the "values" of their
+# partition columns: readers prune the files from filter predicates with the log alone, the partition columns stay
+# in the files as well (a single value per file, dictionary encoded) - readers take the columns from the files and
+# do not parse the paths (no hive partitioning), the types do not depend on the layout.
+# Auxiliary files of the writer (e.g. key indexes) are written to <table>/_index/ and referenced in the metadata
+# ("indexes": {name: key}), vacuum keeps them as long as a retained version references them.
+
+LOG_DIR = "_log/"
+LATEST_NAME = "_latest.json"
+DATA_DIR = "data/"
+INDEX_DIR = "_index/"
+# rows per row group: the min/max statistics of a row group let readers skip it, a file of a partition is sorted
+ROW_GROUP_SIZE = 100_000
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# filter predicates as for pyarrow/pandas (column, op, value), e.g. [("year", ">=", 2023), ("store_name", "in", [...])]
+FILTER_OPS = {
+    "=": operator.eq, "==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt,
+    ">=": operator.ge, "in": lambda value, values: value in values, "not in": lambda value, values: value not in values
+}
+
+
+class CommitConflict(Exception):
+    pass
+
+
+def partition_path(values: dict) -> str:
+    return "/".join(f"{column}={NULL_PARTITION if value is None else quote(str(value), safe=' ')}"
+                    for column, value in values.items())
+
+
+# False if the partition values of the entry cannot satisfy the filters (predicates on other columns are ignored)
+def matches(entry: dict, filters) -> bool:
+    values = entry.get("values", {})
+    for column, op, value in filters or ():
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unknown filter operator {op!r}")
+        if column in values and values[column] is not None and not FILTER_OPS[op](values[column], value):
+            return False
+    return True
+
+
+def is_conflict(err: ClientError) -> bool:
+    return err.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict")
+
+
+class Table:
+    def __init__(self, s3, bucket: str, prefix: str, max_retries: int = 10):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/") + "/"
+        self.max_retries = max_retries
+
+    def _version_key(self, version: int) -> str:
+        return f"{self.prefix}{LOG_DIR}{version:020d}.json"
+
+    def _get_json(self, key: str):
+        try:
+            return json.loads(self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read())
+        except ClientError as err:
+            if err.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def _exists(self, key: str) -> bool:
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as err:
+            if err.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return False
+            raise
+
+    # -1: the table has no commits yet
+    def latest_version(self) -> int:
+        hint = self._get_json(self.prefix + LOG_DIR + LATEST_NAME)
+        version = hint["version"] if hint else -1
+        # the hint is written after the commit and may lag behind
+        while self._exists(self._version_key(version + 1)):
+            version += 1
+        return version
+
+    # the snapshot of the given version/point in time, default: the latest
+    def snapshot(self, version: int = None, as_of: datetime.datetime = None) -> dict:
+        if as_of is not None:
+            version = self.version_as_of(as_of)
+        if version is None:
+            version = self.latest_version()
+        if version < 0:
+            return {"version": -1, "timestamp": None, "files": [], "metadata": {}}
+        snapshot = self._get_json(self._version_key(version))
+        if snapshot is None:
+            raise ValueError(f"Version {version} of table {self.prefix} does not exist (vacuumed?)")
+        return snapshot
+
+    # the commits of the table (without the file lists), oldest first
+    def history(self) -> list[dict]:
+        commits = []
+        for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket,
+                                                                      Prefix=self.prefix + LOG_DIR):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(LATEST_NAME):
+                    continue
+                snapshot = self._get_json(obj["Key"])
+                if snapshot is not None:
+                    commits.append({key: snapshot[key] for key in ("version", "timestamp", "operation")}
+                                   | {"added": len(snapshot["added"]), "removed": len(snapshot["removed"]),
+                                      "files": len(snapshot["files"])})
+        return sorted(commits, key=lambda commit: commit["version"])
+
+    # the latest version committed at or before the given point in time
+    def version_as_of(self, as_of: datetime.datetime) -> int:
+        if as_of.tzinfo is None:
+            as_of = as_of.replace(tzinfo=datetime.timezone.utc)
+        versions = [commit["version"] for commit in self.history()
+                    if datetime.datetime.fromisoformat(commit["timestamp"]) <= as_of]
+        if not versions:
+            raise ValueError(f"Table {self.prefix} has no version before {as_of}")
+        return versions[-1]
+
+    # the files of a version, without the partitions which cannot match the filters
+    def files(self, version: int = None, as_of: datetime.datetime = None, filters=None) -> list[str]:
+        return [entry["key"] for entry in self.snapshot(version, as_of)["files"] if matches(entry, filters)]
+
+    def read(self, version: int = None, as_of: datetime.datetime = None, columns: list[str] = None,
+             filters=None) -> pd.DataFrame:
+        return self.read_files(self.files(version, as_of, filters), columns, filters)
+
+    # the filters are applied to the rows as well (row groups are skipped by their statistics)
+    def read_files(self, keys: list[str], columns: list[str] = None, filters=None) -> pd.DataFrame:
+        if not keys:
+            return pd.DataFrame(columns=columns)
+        return fetch_table(self.s3, self.bucket, keys, columns, filters).to_pandas()
+
+    def data_key(self, partition: str = None) -> str:
+        subdir = f"{partition}/" if partition else ""
+        return f"{self.prefix}{DATA_DIR}{subdir}{uuid.uuid4().hex}.parquet"
+
+    @staticmethod
+    def file_entry(key: str, size: int, rows: int, partition: str = None, values: dict = None) -> dict:
+        entry = {"key": key, "size": size, "rows": rows}
+        if partition:
+            entry["partition"] = partition
+        if values:
+            entry["values"] = values
+        return entry
+
+    # upload a data file, it becomes visible with the commit which adds it
+    def write_file(self, df: pd.DataFrame, partition: str = None, values: dict = None,
+                   row_group_size: int = ROW_GROUP_SIZE) -> dict:
+        key = self.data_key(partition)
+        buffer = BytesIO()
+        df.to_parquet(buffer, engine="pyarrow", index=False, row_group_size=row_group_size, write_statistics=True)
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=buffer.getvalue())
+        return self.file_entry(key, buffer.tell(), len(df), partition, values)
+
+    # one file per combination of the partition_by columns (hive style), each sorted by sort_by
+    def write_partitioned(self, df: pd.DataFrame, partition_by: list[str], sort_by: list[str] = None,
+                          row_group_size: int = ROW_GROUP_SIZE) -> list[dict]:
+        entries = []
+        for group, part in df.groupby(list(partition_by), dropna=False, sort=True, observed=True):
+            group = group if isinstance(group, tuple) else (group,)
+            # numpy scalars/NaN as JSON values
+            values = {column: None if pd.isna(value) else getattr(value, "item", lambda: value)()
+                      for column, value in zip(partition_by, group)}
+            if sort_by:
+                part = part.sort_values(list(sort_by))
+            entries.append(self.write_file(part, partition_path(values), values, row_group_size))
+        return entries
+
+    # upload a parquet file written to a (temporary) file object, large files are uploaded in parts
+    def upload_file(self, fileobj, rows: int, partition: str = None) -> dict:
+        key = self.data_key(partition)
+        size = fileobj.seek(0, 2)
+        fileobj.seek(0)
+        self.s3.upload_fileobj(fileobj, self.bucket, key)
+        return self.file_entry(key, size, rows, partition)
+
+    # upload an auxiliary file of the writer (referenced in the "indexes" of the metadata of the commit)
+    def upload_index(self, fileobj, partition: str = None) -> str:
+        subdir = f"{partition}/" if partition else ""
+        key = f"{self.prefix}{INDEX_DIR}{subdir}{uuid.uuid4().hex}.parquet"
+        fileobj.seek(0)
+        self.s3.upload_fileobj(fileobj, self.bucket, key)
+        return key
+
+    # atomically add/remove files; replace_all removes every file of the snapshot the commit is based on
+    # metadata replaces the metadata of the table (None: kept); with base_version the commit fails with a
+    # CommitConflict if another commit happened after that version (the writer has to start over)
+    def commit(self, add: list[dict] = (), remove: list[str] = (), replace_all: bool = False,
+               operation: str = "write", metadata: dict = None, base_version: int = None) -> dict:
+        for _ in range(self.max_retries + 1):
+            current = self.snapshot()
+            if base_version is not None and current["version"] != base_version:
+                raise CommitConflict(f"Table {self.prefix} was changed after version {base_version}")
+            current_keys = {entry["key"] for entry in current["files"]}
+            removed = sorted(current_keys) if replace_all else list(remove)
+            missing = set(removed) - current_keys
+            if missing:
+                raise CommitConflict(f"{len(missing)} file(s) of table {self.prefix} were removed by another commit")
+            removed_set = set(removed)
+            snapshot = {
+                "version": current["version"] + 1,
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "operation": operation,
+                "added": [entry["key"] for entry in add],
+                "removed": removed,
+                "files": [entry for entry in current["files"] if entry["key"] not in removed_set] + list(add),
+                "metadata": current.get("metadata", {}) if metadata is None else metadata
+            }
+            try:
+                self.s3.put_object(Bucket=self.bucket, Key=self._version_key(snapshot["version"]),
+                                   Body=json.dumps(snapshot).encode("utf-8"), ContentType="application/json",
+                                   IfNoneMatch="*")
+            except ClientError as err:
+                if is_conflict(err):
+                    continue
+                raise
+            self.s3.put_object(Bucket=self.bucket, Key=self.prefix + LOG_DIR + LATEST_NAME,
+                               Body=json.dumps({"version": snapshot["version"]}).encode("utf-8"),
+                               ContentType="application/json")
+            return snapshot
+        raise CommitConflict(f"Could not commit to table {self.prefix} after {self.max_retries} retries")
+
+    def append(self, df: pd.DataFrame) -> dict:
+        return self.commit(add=[self.write_file(df)], operation="append")
+
+    def overwrite(self, df: pd.DataFrame, partition_by: list[str] = None, sort_by: list[str] = None) -> dict:
+        if partition_by:
+            return self.commit(add=self.write_partitioned(df, partition_by, sort_by), replace_all=True,
+                               operation="overwrite")
+        return self.commit(add=[self.write_file(df.sort_values(list(sort_by)) if sort_by else df)],
+                           replace_all=True, operation="overwrite")
+
+    # delete the log entries older than the retained versions and the data/index files no retained version references
+    # (data files younger than min_age_seconds are kept, they may belong to a running commit)
+    def vacuum(self, retain_versions: int = 10, min_age_seconds: float = 3600.0) -> int:
+        latest = self.latest_version()
+        oldest_retained = max(0, latest - retain_versions + 1)
+        referenced = set()
+        for version in range(oldest_retained, latest + 1):
+            snapshot = self.snapshot(version)
+            referenced.update(entry["key"] for entry in snapshot["files"])
+            referenced.update(snapshot.get("metadata", {}).get("indexes", {}).values())
+
+        deadline = time.time() - min_age_seconds
+        expired = []
+        for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                if key.startswith(self.prefix + LOG_DIR):
+                    name = key[len(self.prefix + LOG_DIR):]
+                    if name != LATEST_NAME and int(name.split(".")[0]) < oldest_retained:
+                        expired.append(key)
+                elif key not in referenced and obj["LastModified"].timestamp() < deadline:
+                    expired.append(key)
+        for i in range(0, len(expired), 1000):
+            self.s3.delete_objects(Bucket=self.bucket,
+                                   Delete={"Objects": [{"Key": key} for key in expired[i:i + 1000]], "Quiet": True})
+        return len(expired)
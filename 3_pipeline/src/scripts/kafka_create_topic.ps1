@@ -1,10 +1,12 @@
 $containerName = "kafka"
 $topicName = "weather-data-pipeline"
 $kafkaHost = "kafka:9092"
+# partitions limit the parallelism of the consumers (records are keyed by location)
+$partitions = 6
 
 docker exec -it $containerName `
   kafka-topics.sh --create `
   --bootstrap-server $kafkaHost `
   --topic $topicName `
-  --partitions 1 `
+  --partitions $partitions `
   --replication-factor 1
\ No newline at end of file
@@ -2,10 +2,12 @@
 CONTAINER_NAME="kafka"
 TOPIC_NAME="weather-data-pipeline"
 KAFKA_HOST="kafka:9092"
+# partitions limit the parallelism of the consumers (records are keyed by location)
+PARTITIONS=6
 
 docker exec -it ${CONTAINER_NAME} \
   kafka-topics.sh --create \
   --bootstrap-server ${KAFKA_HOST} \
   --topic ${TOPIC_NAME} \
-  --partitions 1 \
+  --partitions ${PARTITIONS} \
   --replication-factor 1
\ No newline at end of file
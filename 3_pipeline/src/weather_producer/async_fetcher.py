@@ -0,0 +1,113 @@
+import asyncio
+import inspect
+import random
+import threading
+import time
+
+import aiohttp
+
+import producer_metrics
+from http_cache import ResponseCache
+from weather_locations import Location
+
+OPEN_METEO_URL = 'https://api.open-meteo.com/v1/forecast'
+HOURLY_FIELDS = 'temperature_2m,relative_humidity_2m,wind_speed_10m'
+
+# status codes which are worth another try
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def weather_params(lat, long, forecast_days):
+    return {
+        'latitude': lat,
+        'longitude': long,
+        'hourly': HOURLY_FIELDS,
+        'timezone': 'UTC',
+        'forecast_days': forecast_days  # look into the future
+    }
+
+
+# one pooled session is shared by all requests - connections to the API host are kept alive and reused
+def create_session(concurrency: int, timeout_seconds: float) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+# fetch the weather-data of a single location, retry with exponential backoff (and jitter) on transient errors
+# with a cache: fresh responses are used directly, stale ones are revalidated or used if the upstream fails
+async def fetch_location(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, location: Location,
+                         forecast_days, retries: int, backoff_seconds: float, cache: ResponseCache = None):
+    params = weather_params(location.lat, location.long, forecast_days)
+    entry = cache.lookup(OPEN_METEO_URL, params) if cache is not None else None
+    if cache is not None and cache.is_fresh(entry):
+        return entry['body']
+    stale_ok = cache is not None and cache.is_usable_stale(entry)
+    headers = cache.conditional_headers(entry) if cache is not None else {}
+    # do not wait long for a slow upstream if a stale response can be used
+    request_settings = {'timeout': aiohttp.ClientTimeout(total=cache.stale_timeout_seconds)} if stale_ok else {}
+
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.get(OPEN_METEO_URL, params=params, headers=headers,
+                                       **request_settings) as response:
+                    producer_metrics.FETCH_LATENCY.observe(time.perf_counter() - started)
+                    if response.status == 304 and entry is not None:
+                        return cache.revalidated(OPEN_METEO_URL, params, entry, response.headers)
+                    if response.status not in RETRY_STATUS:
+                        response.raise_for_status()
+                        body = await response.json()
+                        if cache is not None:
+                            cache.store(OPEN_METEO_URL, params, response.headers, body)
+                        return body
+                    last_error = f"HTTP {response.status}"
+                    producer_metrics.FETCH_ERRORS.labels(f"http_{response.status}").inc()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            producer_metrics.FETCH_ERRORS.labels(type(err).__name__).inc()
+            if isinstance(err, aiohttp.ClientResponseError) and err.status not in RETRY_STATUS:
+                raise
+            last_error = repr(err)
+        if stale_ok:
+            print(f"Fetch for {location.name} failed ({last_error}), using cached response")
+            return cache.serve_stale(entry)
+        if attempt < retries:
+            delay = backoff_seconds * (2 ** attempt) * (1 + random.random())
+            print(f"Fetch for {location.name} failed ({last_error}), retry in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise RuntimeError(f"Could not fetch weather-data for {location.name}: {last_error}")
+
+
+# fetch all locations concurrently; on_result is called as soon as a single response arrives
+# (on_result may be a coroutine function, e.g. to wait for a free slot in a bounded queue)
+# a set stop event cancels the remaining fetches, the locations which were not fetched are counted as failed
+async def fetch_locations(locations: list[Location], forecast_days, on_result, concurrency: int = 10,
+                          retries: int = 3, backoff_seconds: float = 0.5, timeout_seconds: float = 30.0,
+                          cache: ResponseCache = None, stop: threading.Event = None):
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def fetch(location):
+        return location, await fetch_location(session, semaphore, location, forecast_days, retries, backoff_seconds,
+                                              cache)
+
+    async with create_session(concurrency, timeout_seconds) as session:
+        tasks = [asyncio.create_task(fetch(location)) for location in locations]
+        for completed, next_done in enumerate(asyncio.as_completed(tasks)):
+            if stop is not None and stop.is_set():
+                next_done.close()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                print(f"Stopped, {len(tasks) - completed} locations were not published")
+                return failed + len(tasks) - completed
+            try:
+                location, weather_data = await next_done
+                result = on_result(location, weather_data)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as err:
+                failed += 1
+                print(f"Got Error {err=}")
+    return failed
@@ -0,0 +1,87 @@
+import asyncio
+import queue
+import signal
+import threading
+import time
+
+import producer_metrics
+
+# marks the end of the publish queue
+_CLOSE = object()
+
+
+# produce a single message; on a full local librdkafka queue (BufferError) wait with a timed poll until
+# deliveries have freed space and retry - the producer slows down instead of failing
+# returns True if the produce call had to wait
+def produce_blocking(producer, kafka_topic, value, key=None, on_delivery=None, poll_timeout: float = 0.1) -> bool:
+    blocked_since = None
+    while True:
+        try:
+            producer.produce(kafka_topic, value=value, key=key, callback=on_delivery)
+            break
+        except BufferError:
+            if blocked_since is None:
+                blocked_since = time.perf_counter()
+                producer_metrics.BACKPRESSURE_EVENTS.labels('kafka').inc()
+            producer.poll(poll_timeout)
+    if blocked_since is None:
+        return False
+    producer_metrics.BLOCKED_SECONDS.labels('kafka').inc(time.perf_counter() - blocked_since)
+    return True
+
+
+# Bounded queue between the fetchers and the Kafka producer.
+# The fetched responses are published by a single publisher thread; if the queue is full, the fetch loop waits
+# for a free slot (the fetched responses are not taken over) until the publisher has caught up.
+# Errors of the handler are counted per item, like the failed fetches.
+class PublishQueue:
+    def __init__(self, handle, maxsize: int = 100):
+        self._handle = handle
+        self._queue = queue.Queue(maxsize)
+        self.failed = 0
+        producer_metrics.PUBLISH_QUEUE_DEPTH.set_function(self._queue.qsize)
+        self._thread = threading.Thread(target=self._run, name='publisher', daemon=True)
+        self._thread.start()
+
+    def put(self, *item):
+        try:
+            self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            producer_metrics.BACKPRESSURE_EVENTS.labels('publish').inc()
+        started = time.perf_counter()
+        self._queue.put(item)
+        producer_metrics.BLOCKED_SECONDS.labels('publish').inc(time.perf_counter() - started)
+
+    # used as on_result of fetch_locations: waiting for a slot does not block the event loop (running requests)
+    async def put_async(self, *item):
+        await asyncio.to_thread(self.put, *item)
+
+    def _run(self):
+        while (item := self._queue.get()) is not _CLOSE:
+            try:
+                self._handle(*item)
+            except Exception as err:
+                self.failed += 1
+                print(f"Got Error {err=}")
+
+    # publish everything which is queued and stop the publisher thread, returns the number of failed items
+    def close(self) -> int:
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        return self.failed
+
+
+# flush the outstanding messages (e.g. on shutdown), report what could not be delivered within the timeout
+def drain(producer, timeout: float) -> int:
+    remaining = producer.flush(timeout)
+    if remaining > 0:
+        print(f"{remaining} messages could not be delivered within {timeout:.0f}s")
+    return remaining
+
+
+# SIGTERM (docker stop) sets the returned event, the running fetches are stopped and the queues drained
+def stop_on_sigterm() -> threading.Event:
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    return stop
@@ -0,0 +1,51 @@
+import json
+
+from benchmark_utils import best_of, env_int, synthetic_hourly_data
+from weather_locations import Location
+from weather_serializer import ArrowBatchSerializer, ColumnarJsonSerializer
+
+# Microbenchmark of the record encoding (no kafka involved):
+# the per-record loop (dict + json.dumps) vs. the columnar encodings.
+
+
+# the encoding of publish_records without the columnar serializer
+def per_record_loop(hourly_data, location):
+    payloads = []
+    for i, timestamp in enumerate(hourly_data['time']):
+        record = {
+            'timestamp': timestamp,
+            'temperature': hourly_data['temperature_2m'][i],
+            'humidity': hourly_data['relative_humidity_2m'][i],
+            'wind_speed': hourly_data['wind_speed_10m'][i]
+        }
+        record['location'] = location.name
+        record['latitude'] = float(location.lat)
+        record['longitude'] = float(location.long)
+        payloads.append((timestamp, json.dumps(record).encode('utf-8')))
+    return payloads
+
+
+def measure(name, encode, hourly_data, location, repeat):
+    best, payloads = best_of(lambda: encode(hourly_data, location), repeat)
+    hours = len(hourly_data['time'])
+    print(f"{name:24s} {hours / best:14,.0f} hours/s  {best * 1000:8.1f}ms  "
+          f"messages: {len(payloads):8d}  bytes: {sum(len(p) for _, p in payloads):12,d}")
+    return best
+
+
+def main():
+    # e.g. 100 sites x 16 forecast days
+    hours = env_int("BENCHMARK_HOURS", 100 * 16 * 24)
+    repeat = env_int("BENCHMARK_REPEAT", 5)
+    hourly_data = synthetic_hourly_data(hours)
+    location = Location(name="fh", lat="47.72", long="13.09")
+
+    print(f"Encoding {hours} hours (best of {repeat})")
+    baseline = measure("per-record json", per_record_loop, hourly_data, location, repeat)
+    columnar = measure("columnar json", ColumnarJsonSerializer().encode_columns, hourly_data, location, repeat)
+    arrow = measure("arrow ipc (24h/message)", ArrowBatchSerializer(24).encode_columns, hourly_data, location, repeat)
+    print(f"speedup columnar json: {baseline / columnar:.1f}x, arrow ipc: {baseline / arrow:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
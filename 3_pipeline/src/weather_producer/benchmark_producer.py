@@ -0,0 +1,45 @@
+import sys
+
+from confluent_kafka import Producer
+
+from benchmark_utils import best_of, broker_config, env_int, synthetic_weather_data
+from delivery_stats import DeliveryStats
+from kafka_weather_producer import THROUGHPUT_DEFAULTS, get_env_default, publish_records
+
+# Benchmark of the producer settings: messages/sec and delivery latency.
+# Without KAFKA_BROKER the librdkafka mock cluster is used as a local broker stand-in.
+
+
+def run(name, config, weather_data, kafka_topic):
+    stats = DeliveryStats(keep_latencies=True)
+    producer = Producer(config)
+
+    def produce():
+        publish_records(producer, weather_data, kafka_topic, on_delivery=stats.on_delivery)
+        producer.flush()
+
+    elapsed, _ = best_of(produce)
+
+    p99 = stats.percentile(99) or 0.0
+    print(f"{name:12s} {stats.delivered / elapsed:12,.0f} msg/s  "
+          f"p50: {(stats.percentile(50) or 0.0) * 1000:7.1f}ms  p99: {p99 * 1000:7.1f}ms  "
+          f"failed: {stats.failed}")
+
+
+def main():
+    kafka_broker = get_env_default("KAFKA_BROKER", "")
+    kafka_topic = get_env_default("KAFKA_TOPIC", "weather-benchmark")
+    messages = env_int("BENCHMARK_MESSAGES", 200000)
+
+    base = broker_config(kafka_broker)
+    weather_data = synthetic_weather_data(messages)
+    print(f"Producing {messages} messages to {kafka_broker or 'mock cluster'}")
+
+    run("default", dict(base), weather_data, kafka_topic)
+    run("throughput", {**base, **THROUGHPUT_DEFAULTS}, weather_data, kafka_topic)
+    run("zstd", {**base, **THROUGHPUT_DEFAULTS, 'compression.type': 'zstd'}, weather_data, kafka_topic)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
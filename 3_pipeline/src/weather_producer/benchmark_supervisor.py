@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+import sys
+import time
+
+from confluent_kafka import Producer
+
+from benchmark_utils import broker_config, env_int, synthetic_weather_data
+from delivery_stats import DeliveryStats
+from kafka_weather_producer import THROUGHPUT_DEFAULTS, get_env_default, publish_records
+from producer_supervisor import assign_shards
+from weather_locations import Location
+from weather_serializer import create_serializer
+
+# Scaling benchmark of the sharded producer: the synthetic locations are sharded over 1..N worker processes
+# (like producer_supervisor), every worker serializes and produces its locations with its own Producer.
+# Without KAFKA_BROKER every worker uses its own librdkafka mock cluster.
+
+
+def produce_shard(settings):
+    locations, hours, serializer, kafka_broker, kafka_topic = settings
+    producer = Producer({**broker_config(kafka_broker), **THROUGHPUT_DEFAULTS})
+    serialize = create_serializer(serializer, registry_path="schema_registry/registry.json",
+                                  subject="weather-data-pipeline-value")
+    stats = DeliveryStats()
+    weather_data = synthetic_weather_data(hours)
+    for location in locations:
+        publish_records(producer, weather_data, kafka_topic, location=location, on_delivery=stats.on_delivery,
+                        serialize=serialize)
+    producer.flush()
+    return stats.delivered
+
+
+def main():
+    kafka_broker = get_env_default("KAFKA_BROKER", "")
+    kafka_topic = get_env_default("KAFKA_TOPIC", "weather-benchmark")
+    location_count = env_int("BENCHMARK_LOCATIONS", 500)
+    hours = env_int("BENCHMARK_HOURS", 96)
+    max_workers = env_int("BENCHMARK_MAX_WORKERS", os.cpu_count() or 1)
+    serializer = get_env_default("WEATHER_SERIALIZER", "avro")
+
+    locations = [Location(name=f"location-{i}", lat=str(47 + i * 0.001), long=str(13 + i * 0.001))
+                 for i in range(location_count)]
+    print(f"Producing {location_count} locations x {hours} hours ({serializer}) to "
+          f"{kafka_broker or 'mock cluster'}, {os.cpu_count()} cpus")
+
+    context = multiprocessing.get_context('spawn')
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        shards = [shard for shard in assign_shards(locations, workers) if shard]
+        with context.Pool(workers) as pool:
+            # start the processes/imports before the measurement
+            pool.map(abs, range(workers))
+            start = time.perf_counter()
+            delivered = sum(pool.map(produce_shard,
+                                     [(shard, hours, serializer, kafka_broker, kafka_topic) for shard in shards]))
+            elapsed = time.perf_counter() - start
+        rate = delivered / elapsed
+        baseline = baseline or rate
+        print(f"{workers:3d} workers {rate:12,.0f} msg/s  speedup: {rate / baseline:5.2f}x  "
+              f"shard sizes: {min(map(len, shards))}-{max(map(len, shards))}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import time
+
+from kafka_weather_producer import get_env_default
+
+# Shared scaffold of the producer benchmarks (benchmark_producer, benchmark_encoding, benchmark_supervisor):
+# settings from the environment, the broker config, best-of-n timing and synthetic open-meteo data.
+
+
+def env_int(key: str, default: int) -> int:
+    return int(get_env_default(key, str(default)))
+
+
+# without a broker the librdkafka mock cluster is used as a local broker stand-in
+def broker_config(kafka_broker: str) -> dict:
+    return {'bootstrap.servers': kafka_broker} if kafka_broker else {'test.mock.num.brokers': 1}
+
+
+# the fastest of repeat runs of function and its (last) result
+def best_of(function, repeat: int = 1):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+# hourly columns of a synthetic open-meteo response with the given number of hours
+def synthetic_hourly_data(hours: int):
+    return {
+        'time': [f"2025-01-{1 + i // 24 % 28:02d}T{i % 24:02d}:00" for i in range(hours)],
+        'temperature_2m': [round(10 + (i % 24) * 0.5, 1) for i in range(hours)],
+        'relative_humidity_2m': [60 + i % 30 for i in range(hours)],
+        'wind_speed_10m': [round(3 + (i % 10) * 0.7, 1) for i in range(hours)],
+    }
+
+
+def synthetic_weather_data(hours: int):
+    return {'hourly': synthetic_hourly_data(hours)}
@@ -0,0 +1,46 @@
+import threading
+
+
+# aggregates the delivery reports of the producer into counters instead of printing one line per message
+class DeliveryStats:
+    def __init__(self, keep_latencies: bool = False):
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.last_error = None
+        # individual latencies are only kept on request (e.g. benchmarks to calculate percentiles)
+        self.latencies = [] if keep_latencies else None
+
+    # use as the on_delivery callback of Producer.produce
+    def on_delivery(self, err, msg):
+        with self._lock:
+            if err is not None:
+                self.failed += 1
+                self.last_error = err
+                return
+            self.delivered += 1
+            self.bytes += len(msg.value() or b'')
+            latency = msg.latency()
+            if latency is not None:
+                self.latency_sum += latency
+                self.latency_max = max(self.latency_max, latency)
+                if self.latencies is not None:
+                    self.latencies.append(latency)
+
+    def percentile(self, p: float):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self) -> str:
+        avg_ms = self.latency_sum / self.delivered * 1000 if self.delivered else 0.0
+        text = (f"Delivered: {self.delivered} messages ({self.bytes} bytes), failed: {self.failed}, "
+                f"latency avg: {avg_ms:.1f}ms, max: {self.latency_max * 1000:.1f}ms")
+        if self.last_error is not None:
+            text += f", last error: {self.last_error}"
+        return text
@@ -0,0 +1,150 @@
+import email.utils
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+
+import requests
+
+
+# normalize the request parameters, the same request results in the same cache key
+# (order of the parameters, 47.7 vs. 47.70, whitespace)
+def normalize_params(params: dict) -> dict:
+    normalized = {}
+    for key, value in params.items():
+        value = str(value).strip()
+        try:
+            value = repr(float(value))
+        except ValueError:
+            pass
+        normalized[str(key)] = value
+    return dict(sorted(normalized.items()))
+
+
+def cache_key(url: str, params: dict) -> str:
+    key = json.dumps([url, normalize_params(params)])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+# seconds the response may be used without asking the upstream again (Cache-Control max-age or Expires)
+def freshness_lifetime(headers) -> float:
+    cache_control = headers.get('Cache-Control', '')
+    if 'no-cache' in cache_control:
+        return 0.0
+    match = re.search(r'max-age=(\d+)', cache_control)
+    if match:
+        return float(match.group(1))
+    if headers.get('Expires') and headers.get('Date'):
+        try:
+            expires = email.utils.parsedate_to_datetime(headers['Expires'])
+            date = email.utils.parsedate_to_datetime(headers['Date'])
+            return max(0.0, (expires - date).total_seconds())
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+
+# A persistent response cache, one json file per request.
+# - fresh entries are returned without a request
+# - stale entries are revalidated with If-None-Match/If-Modified-Since (304 keeps the cached body)
+# - if the upstream fails or is too slow, a stale entry is used as long as it is younger than max_stale_seconds
+class ResponseCache:
+    def __init__(self, directory: str, max_stale_seconds: float = 3600.0, stale_timeout_seconds: float = 5.0):
+        self.directory = directory
+        self.max_stale_seconds = max_stale_seconds
+        # the timeout of a request if a stale entry could be used instead
+        self.stale_timeout_seconds = stale_timeout_seconds
+        # responses served from a stale entry because the upstream failed or was too slow
+        self.stale_responses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url, params):
+        return os.path.join(self.directory, f"{cache_key(url, params)}.json")
+
+    def lookup(self, url: str, params: dict):
+        try:
+            with open(self._path(url, params), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def age(entry) -> float:
+        return time.time() - entry['stored_at']
+
+    def is_fresh(self, entry) -> bool:
+        return entry is not None and self.age(entry) < entry['max_age']
+
+    def is_usable_stale(self, entry) -> bool:
+        return entry is not None and self.age(entry) < entry['max_age'] + self.max_stale_seconds
+
+    def serve_stale(self, entry):
+        self.stale_responses += 1
+        return entry['body']
+
+    @staticmethod
+    def conditional_headers(entry) -> dict:
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url: str, params: dict, headers, body):
+        if 'no-store' in headers.get('Cache-Control', ''):
+            return
+        entry = {
+            'stored_at': time.time(),
+            'max_age': freshness_lifetime(headers),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'body': body
+        }
+        self._write(self._path(url, params), entry)
+
+    # 304 Not Modified: the cached body is still valid, take over the new freshness information
+    def revalidated(self, url: str, params: dict, entry, headers):
+        entry = {**entry,
+                 'stored_at': time.time(),
+                 'max_age': freshness_lifetime(headers) if headers.get('Cache-Control') or headers.get('Expires')
+                 else entry['max_age'],
+                 'etag': headers.get('ETag') or entry.get('etag'),
+                 'last_modified': headers.get('Last-Modified') or entry.get('last_modified')}
+        self._write(self._path(url, params), entry)
+        return entry['body']
+
+    # write to a temp file and replace, concurrent producers never read a partial entry
+    def _write(self, path, entry):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+
+# GET with the cache in front (used by the synchronous fetch path), get: the function sending the request
+def cached_get_json(cache: ResponseCache, url: str, params: dict, timeout: float = 30.0, get=requests.get):
+    entry = cache.lookup(url, params)
+    if cache.is_fresh(entry):
+        return entry['body']
+
+    stale_ok = cache.is_usable_stale(entry)
+    try:
+        response = get(url, params=params, headers=cache.conditional_headers(entry),
+                       timeout=cache.stale_timeout_seconds if stale_ok else timeout)
+        if response.status_code == 304 and entry is not None:
+            return cache.revalidated(url, params, entry, response.headers)
+        response.raise_for_status()
+    except requests.RequestException as err:
+        if stale_ok:
+            print(f"Request failed ({err!r}), using cached response")
+            return cache.serve_stale(entry)
+        raise
+
+    body = response.json()
+    cache.store(url, params, response.headers, body)
+    return body
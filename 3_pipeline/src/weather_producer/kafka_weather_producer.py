@@ -1,37 +1,100 @@
-import json
+import asyncio
 import os
 import sys
+import time
 
 import requests
 from confluent_kafka import Producer
 
+import producer_metrics
+from async_fetcher import OPEN_METEO_URL, fetch_locations, weather_params
+from backpressure import PublishQueue, drain, produce_blocking, stop_on_sigterm
+from delivery_stats import DeliveryStats
+from http_cache import ResponseCache, cached_get_json
+from replay import replay_csv
+from watermark_state import WatermarkState
+from weather_locations import Location, load_locations, message_key
+from weather_serializer import ArrowBatchSerializer, create_serializer, json_serialize
+
+# librdkafka settings tuned for throughput: messages are collected for a short time
+# and sent as larger, compressed batches
+THROUGHPUT_DEFAULTS = {
+    'linger.ms': '50',
+    'batch.size': '1000000',
+    'batch.num.messages': '10000',
+    'compression.type': 'lz4',
+    'acks': '1',
+    'max.in.flight.requests.per.connection': '5',
+}
+
+# environment variables which override the corresponding librdkafka setting
+KAFKA_SETTINGS_ENV = {
+    'KAFKA_LINGER_MS': 'linger.ms',
+    'KAFKA_BATCH_SIZE': 'batch.size',
+    'KAFKA_BATCH_NUM_MESSAGES': 'batch.num.messages',
+    'KAFKA_COMPRESSION_TYPE': 'compression.type',
+    'KAFKA_ACKS': 'acks',
+    'KAFKA_MAX_IN_FLIGHT': 'max.in.flight.requests.per.connection',
+    'KAFKA_PARTITIONER': 'partitioner',
+    # size of the local producer queue, produce() blocks (backpressure) if it is full
+    'KAFKA_QUEUE_MAX_MESSAGES': 'queue.buffering.max.messages',
+    'KAFKA_QUEUE_MAX_KBYTES': 'queue.buffering.max.kbytes',
+}
+
+
+# GET request to the weather API with its latency recorded (responses served from the cache are not recorded)
+def timed_get(url, **kwargs):
+    started = time.perf_counter()
+    try:
+        return requests.get(url, **kwargs)
+    finally:
+        producer_metrics.FETCH_LATENCY.observe(time.perf_counter() - started)
+
 
 # Function to fetch weather data
-def fetch_weather_data(lat, long, forecast_days):
-    url = 'https://api.open-meteo.com/v1/forecast'
-    params = {
-        'latitude': lat,
-        'longitude': long,
-        'hourly': 'temperature_2m,relative_humidity_2m,wind_speed_10m',
-        'timezone': 'UTC',
-        'forecast_days': forecast_days  # look into the future
-    }
-    response = requests.get(url, params=params)
-    return response.json()
+def fetch_weather_data(lat, long, forecast_days, cache=None):
+    params = weather_params(lat, long, forecast_days)
+    try:
+        if cache is not None:
+            return cached_get_json(cache, OPEN_METEO_URL, params, get=timed_get)
+        response = timed_get(OPEN_METEO_URL, params=params)
+        return response.json()
+    except Exception as err:
+        producer_metrics.FETCH_ERRORS.labels(type(err).__name__).inc()
+        raise
 
 
-# take the fetched weather-data and publish it to a given Kafka topic
-def publish_to_kafka(weather_data, kafka_broker, kafka_topic):
+# Callback to report failed deliveries, successful ones are only counted (see DeliveryStats)
+def delivery_report(err, msg):
+    if err is not None:
+        print(f"Delivery failed: {err}")
 
-    # Callback to confirm delivery
-    def delivery_report(err, msg):
-        if err is not None:
-            print(f"Delivery failed: {err}")
-        else:
-            print(f"Sent: {msg.value().decode('utf-8')}")
 
-    producer = Producer({'bootstrap.servers': kafka_broker})
+# counts the deliveries in the given stats (printed once per run) and reports the failed ones
+def counting_delivery_report(stats):
+    def on_delivery(err, msg):
+        stats.on_delivery(err, msg)
+        delivery_report(err, msg)
+    return on_delivery
+
+
+# produce the hourly records of the fetched weather-data with the given producer
+# if a location is given, the records are tagged with it to distinguish multiple locations
+# the records are keyed by location (see message_key), without a location the coordinates of the response are used
+def publish_records(producer, weather_data, kafka_topic, location=None, on_delivery=delivery_report,
+                    serialize=json_serialize, key_mode='location'):
     hourly_data = weather_data['hourly']
+    location_key = location.name if location is not None \
+        else f"{weather_data.get('latitude')},{weather_data.get('longitude')}"
+
+    # columnar serializers encode all hours in bulk
+    if hasattr(serialize, 'encode_columns'):
+        for timestamp, payload in serialize.encode_columns(hourly_data, location):
+            produce_blocking(producer, kafka_topic, payload, key=message_key(key_mode, location_key, timestamp),
+                             on_delivery=on_delivery)
+            producer.poll(0)
+        return
+
     for i, timestamp in enumerate(hourly_data['time']):
         record = {
             'timestamp': timestamp,
@@ -39,13 +102,133 @@ def publish_to_kafka(weather_data, kafka_broker, kafka_topic):
             'humidity': hourly_data['relative_humidity_2m'][i],
             'wind_speed': hourly_data['wind_speed_10m'][i]
         }
-        payload = json.dumps(record).encode('utf-8')
-        producer.produce(kafka_topic, value=payload, callback=delivery_report)
+        if location is not None:
+            record['location'] = location.name
+            record['latitude'] = float(location.lat)
+            record['longitude'] = float(location.long)
+        payload = serialize(record)
+        produce_blocking(producer, kafka_topic, payload, key=message_key(key_mode, location_key, timestamp),
+                         on_delivery=on_delivery)
         producer.poll(0)  # Trigger delivery report callbacks
 
+
+# publish the records within a kafka transaction: consumers reading read_committed see all records or none
+# (commit_transaction flushes the outstanding messages)
+def publish_transaction(producer, weather_data, kafka_topic, **publish_settings):
+    producer.begin_transaction()
+    try:
+        publish_records(producer, weather_data, kafka_topic, **publish_settings)
+        producer.commit_transaction()
+    except Exception:
+        producer.abort_transaction()
+        raise
+
+
+# a producer with transactional.id needs to register the transactions (and fences older instances)
+def create_producer(config, transactional=False):
+    producer = Producer(config)
+    producer_metrics.watch_producer(producer)
+    if transactional:
+        producer.init_transactions()
+    return producer
+
+
+# take the fetched weather-data and publish it to a given Kafka topic
+def publish_to_kafka(weather_data, kafka_broker, kafka_topic, config=None, on_delivery=delivery_report,
+                     serialize=json_serialize, key_mode='location', transactional=False):
+    producer = create_producer(config or {'bootstrap.servers': kafka_broker}, transactional)
+    publish = publish_transaction if transactional else publish_records
+    publish(producer, weather_data, kafka_topic, on_delivery=on_delivery, serialize=serialize, key_mode=key_mode)
     producer.flush()
 
 
+# fetch many locations concurrently and publish the records of each location as soon as its response arrives
+# the responses pass a bounded queue to the publisher thread; on SIGTERM the running fetches are stopped,
+# the queued responses are published and the producer is flushed
+def publish_locations(locations, forecast_days, kafka_broker, kafka_topic,
+                      concurrency, retries, backoff_seconds, timeout_seconds, cache=None,
+                      config=None, on_delivery=delivery_report, serialize=json_serialize, key_mode='location',
+                      transactional=False, queue_size=100, flush_timeout=30.0):
+    producer = create_producer(config or {'bootstrap.servers': kafka_broker}, transactional)
+    # transactional: one transaction per location
+    publish = publish_transaction if transactional else publish_records
+    stop = stop_on_sigterm()
+
+    def on_result(location, weather_data):
+        publish(producer, weather_data, kafka_topic, location=location, on_delivery=on_delivery,
+                serialize=serialize, key_mode=key_mode)
+
+    publish_queue = PublishQueue(on_result, queue_size)
+    failed = 0
+    try:
+        failed = asyncio.run(fetch_locations(locations, forecast_days, publish_queue.put_async,
+                                             concurrency=concurrency,
+                                             retries=retries,
+                                             backoff_seconds=backoff_seconds,
+                                             timeout_seconds=timeout_seconds,
+                                             cache=cache,
+                                             stop=stop))
+    finally:
+        failed += publish_queue.close()
+        drain(producer, flush_timeout)
+    return failed
+
+
+# long-running mode: fetch all locations every interval and publish only the hours which are new or changed
+# since the last publish (per-location watermark in a local state file)
+# SIGTERM stops the running cycle: the queued responses are still published and flushed
+def run_daemon(locations, tag_locations, forecast_days, kafka_topic, config, serialize, key_mode,
+               interval_seconds, state_path, fetch_settings, metrics_enabled=False, transactional=False,
+               queue_size=100, flush_timeout=30.0):
+    producer = create_producer(config, transactional)
+    state = WatermarkState(state_path)
+    stop = stop_on_sigterm()
+
+    while not stop.is_set():
+        started = time.monotonic()
+        stats = DeliveryStats()
+        on_delivery = counting_delivery_report(stats)
+        if metrics_enabled:
+            on_delivery = producer_metrics.with_metrics(on_delivery)
+
+        def on_result(location, weather_data):
+            new_hours = state.filter_new_hours(location.name, weather_data)
+            publish_settings = {'location': location if tag_locations else None,
+                                'on_delivery': on_delivery,
+                                'serialize': serialize,
+                                'key_mode': key_mode}
+            # a location which failed partway is sent again next time (its hours are not committed with the run)
+            try:
+                if not transactional:
+                    publish_records(producer, new_hours, kafka_topic, **publish_settings)
+                    return
+                # the watermark of the location moves together with its transaction
+                publish_transaction(producer, new_hours, kafka_topic, **publish_settings)
+            except Exception:
+                state.rollback([location.name])
+                raise
+            state.commit([location.name])
+
+        publish_queue = PublishQueue(on_result, queue_size)
+        failed = 0
+        try:
+            failed = asyncio.run(fetch_locations(locations, forecast_days, publish_queue.put_async, stop=stop,
+                                                 **fetch_settings))
+        finally:
+            failed += publish_queue.close()
+        remaining = drain(producer, flush_timeout)
+        # the watermark only moves if everything was delivered, otherwise the hours are sent again next time
+        if stats.failed == 0 and remaining == 0:
+            state.commit()
+        else:
+            state.rollback()
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {stats.summary()}, failed locations: {failed}")
+
+        # wait for the next run (interrupted by SIGTERM)
+        stop.wait(max(0.0, interval_seconds - (time.monotonic() - started)))
+    print("Shutting down...")
+
+
 # get the given key from the environment or use default value
 def get_env_default(key: str, default_val: str) -> str:
     val = os.environ.get(key)
@@ -54,6 +237,28 @@ def get_env_default(key: str, default_val: str) -> str:
     return val
 
 
+# the producer configuration: throughput mode enables batching/compression defaults,
+# single settings can be overridden via the environment
+def kafka_config(kafka_broker, throughput_mode=False):
+    # murmur2 hashing of the key, the same partitions as the java clients
+    config = {'bootstrap.servers': kafka_broker, 'partitioner': 'murmur2_random'}
+    if throughput_mode:
+        config.update(THROUGHPUT_DEFAULTS)
+    # exactly-once: idempotent producer (no duplicates/reordering on retries) and transactions,
+    # the transactional.id needs to be stable across restarts of the same producer instance
+    transactional_id = get_env_default("KAFKA_TRANSACTIONAL_ID", "")
+    if transactional_id != "":
+        config['transactional.id'] = transactional_id
+    if transactional_id != "" or get_env_default("KAFKA_IDEMPOTENCE", "false").lower() == "true":
+        # idempotence requires acks=all (max 5 in-flight requests keep the ordering)
+        config.update({'enable.idempotence': 'true', 'acks': 'all'})
+    for env_key, setting in KAFKA_SETTINGS_ENV.items():
+        val = get_env_default(env_key, "")
+        if val != "":
+            config[setting] = val
+    return config
+
+
 def main():
     # Location: Puch-Urstein
     lat = get_env_default("WEATHER_LOCATION_LAT", "47.72")
@@ -62,15 +267,125 @@ def main():
     # see listener configuration @ kafka
     kafka_broker = get_env_default("KAFKA_BROKER", "localhost:19092")
     kafka_topic = get_env_default("KAFKA_TOPIC", "weather-data-pipeline")
+    # multiple locations: either a file (json/csv) or inline "name=lat,long;..."
+    locations_file = get_env_default("WEATHER_LOCATIONS_FILE", "")
+    locations = get_env_default("WEATHER_LOCATIONS", "")
+    fetch_settings = {
+        'concurrency': int(get_env_default("FETCH_CONCURRENCY", "10")),
+        'retries': int(get_env_default("FETCH_RETRIES", "3")),
+        'backoff_seconds': float(get_env_default("FETCH_BACKOFF_SECONDS", "0.5")),
+        'timeout_seconds': float(get_env_default("FETCH_TIMEOUT_SECONDS", "30")),
+    }
+    # persistent response cache, shared by producer instances/restarts using the same directory
+    cache = None
+    if get_env_default("HTTP_CACHE", "true").lower() == "true":
+        cache = ResponseCache(get_env_default("HTTP_CACHE_DIR", "cache/http"),
+                              max_stale_seconds=float(get_env_default("HTTP_CACHE_MAX_STALE_SECONDS", "3600")),
+                              stale_timeout_seconds=float(get_env_default("HTTP_CACHE_STALE_TIMEOUT_SECONDS", "5")))
+    fetch_settings['cache'] = cache
+    # backpressure: bounded queue between the fetchers and the producer, max. time to flush on shutdown
+    backpressure_settings = {
+        'queue_size': int(get_env_default("PUBLISH_QUEUE_SIZE", "100")),
+        'flush_timeout': float(get_env_default("SHUTDOWN_FLUSH_TIMEOUT_SECONDS", "30")),
+    }
+    # once: fetch and publish a single time, daemon: run forever and publish new/changed hours only,
+    # replay: load generator which streams the weather csv instead of querying the API
+    producer_mode = get_env_default("PRODUCER_MODE", "once")
+    # throughput mode: batching/compression of the messages
+    throughput_mode = get_env_default("KAFKA_THROUGHPUT_MODE", "false").lower() == "true"
+    config = kafka_config(kafka_broker, throughput_mode)
+    transactional = 'transactional.id' in config
+    # deliveries are counted and summarized once per run, only failures are printed
+    stats = DeliveryStats()
+    on_delivery = counting_delivery_report(stats)
+    # metrics endpoint: deliveries are counted instead of printed, librdkafka statistics are exported
+    metrics_port = get_env_default("METRICS_PORT", "")
+    metrics_enabled = metrics_port != ""
+    if metrics_enabled:
+        producer_metrics.start_metrics_server(int(metrics_port))
+        config['stats_cb'] = producer_metrics.on_stats
+        config['statistics.interval.ms'] = get_env_default("KAFKA_STATISTICS_INTERVAL_MS", "5000")
+        on_delivery = producer_metrics.with_metrics(on_delivery)
+    # wire format of the messages: json, json_columnar, schema-tagged avro (local registry file) or arrow batches
+    serialize = create_serializer(get_env_default("WEATHER_SERIALIZER", "json"),
+                                  registry_path=get_env_default("SCHEMA_REGISTRY_PATH", "schema_registry/registry.json"),
+                                  subject=f"{kafka_topic}-value",
+                                  arrow_batch_hours=int(get_env_default("ARROW_BATCH_HOURS", "24")))
+    # message key/partitioning: none, location or location_day (the partitioner is set via KAFKA_PARTITIONER)
+    key_mode = get_env_default("KAFKA_MESSAGE_KEY", "location")
+
+    if producer_mode == "replay":
+        if isinstance(serialize, ArrowBatchSerializer):
+            print("The replay sends single records, the arrow format is not supported "
+                  "(use json, json_columnar or avro)")
+            sys.exit(2)
+        replay_stats = DeliveryStats()
+        # the load generator is not transactional (idempotence is kept)
+        replay_producer = create_producer({key: value for key, value in config.items() if key != 'transactional.id'})
+        replay_csv(producer=replay_producer,
+                   csv_path=get_env_default("REPLAY_CSV_PATH", "../../input_data/weather_2023_2024.csv"),
+                   kafka_topic=kafka_topic,
+                   serialize=serialize,
+                   key_mode=key_mode,
+                   on_delivery=producer_metrics.with_metrics(replay_stats.on_delivery) if metrics_enabled
+                   else replay_stats.on_delivery,
+                   rate=float(get_env_default("REPLAY_RATE", "0")),
+                   time_compression=float(get_env_default("REPLAY_TIME_COMPRESSION", "0")),
+                   synthetic_locations=int(get_env_default("REPLAY_SYNTHETIC_LOCATIONS", "0")),
+                   loops=int(get_env_default("REPLAY_LOOPS", "1")))
+        print(replay_stats.summary())
+        sys.exit(0)
+
+    if producer_mode == "daemon":
+        multiple_locations = bool(locations_file or locations)
+        run_daemon(locations=load_locations(locations_file, locations) if multiple_locations
+                   else [Location(name=f"{lat},{long}", lat=lat, long=long)],
+                   tag_locations=multiple_locations,
+                   forecast_days=forecast_days,
+                   kafka_topic=kafka_topic,
+                   config=config,
+                   serialize=serialize,
+                   key_mode=key_mode,
+                   interval_seconds=float(get_env_default("DAEMON_INTERVAL_SECONDS", "900")),
+                   state_path=get_env_default("WATERMARK_STATE_PATH", "state/watermarks.json"),
+                   fetch_settings=fetch_settings,
+                   metrics_enabled=metrics_enabled,
+                   transactional=transactional,
+                   **backpressure_settings)
+        sys.exit(0)
+
+    if locations_file or locations:
+        failed = publish_locations(locations=load_locations(locations_file, locations),
+                                   forecast_days=forecast_days,
+                                   kafka_broker=kafka_broker,
+                                   kafka_topic=kafka_topic,
+                                   config=config,
+                                   on_delivery=on_delivery,
+                                   serialize=serialize,
+                                   key_mode=key_mode,
+                                   transactional=transactional,
+                                   **fetch_settings,
+                                   **backpressure_settings)
+        print(stats.summary())
+        if failed > 0:
+            print(f"Could not get weather-data for {failed} location(s)!")
+            sys.exit(2)
+        sys.exit(0)
 
-    weather_data = fetch_weather_data(lat, long, forecast_days)
+    weather_data = fetch_weather_data(lat, long, forecast_days, cache=cache)
     if weather_data is None:
         print("Could not get weather-data!")
         sys.exit(2)
 
     publish_to_kafka(weather_data=weather_data,
                      kafka_broker=kafka_broker,
-                     kafka_topic=kafka_topic)
+                     kafka_topic=kafka_topic,
+                     config=config,
+                     on_delivery=on_delivery,
+                     serialize=serialize,
+                     key_mode=key_mode,
+                     transactional=transactional)
+    print(stats.summary())
     sys.exit(0)
 
 
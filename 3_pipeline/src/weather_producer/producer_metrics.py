@@ -0,0 +1,86 @@
+import json
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Prometheus metrics of the producer, exposed via http://<host>:<METRICS_PORT>/metrics
+# The metric objects are module-global (prometheus_client default registry), recording is cheap even if
+# the endpoint is not started.
+
+RECORDS_PRODUCED = Counter('weather_records_produced_total', 'Records delivered to Kafka')
+BYTES_PRODUCED = Counter('weather_bytes_produced_total', 'Payload bytes delivered to Kafka')
+DELIVERY_ERRORS = Counter('weather_delivery_errors_total', 'Records which could not be delivered')
+DELIVERY_LATENCY = Histogram('weather_delivery_latency_seconds', 'Time from produce() to the delivery report',
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+QUEUE_DEPTH = Gauge('weather_producer_queue_depth', 'Messages/requests waiting in the local producer queue')
+FETCH_LATENCY = Histogram('weather_fetch_latency_seconds', 'Latency of the weather API requests (cache hits are not counted)',
+                          buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+FETCH_ERRORS = Counter('weather_fetch_errors_total', 'Failed weather API requests', ['reason'])
+# backpressure: queue=kafka (local librdkafka queue full) or publish (queue between fetchers and producer full)
+BACKPRESSURE_EVENTS = Counter('weather_producer_backpressure_events_total', 'Times a full queue blocked the producer',
+                              ['queue'])
+BLOCKED_SECONDS = Counter('weather_producer_blocked_seconds_total', 'Time spent waiting for space in a full queue',
+                          ['queue'])
+PUBLISH_QUEUE_DEPTH = Gauge('weather_publish_queue_depth', 'Fetched responses waiting to be published')
+
+# librdkafka statistics (stats_cb), see https://github.com/confluentinc/librdkafka/blob/master/STATISTICS.md
+RDKAFKA_MSG_CNT = Gauge('rdkafka_msg_cnt', 'Messages in the producer queues')
+RDKAFKA_MSG_SIZE = Gauge('rdkafka_msg_size_bytes', 'Bytes of the messages in the producer queues')
+RDKAFKA_TXMSGS = Gauge('rdkafka_txmsgs', 'Messages transmitted to the brokers')
+RDKAFKA_TX_BYTES = Gauge('rdkafka_tx_bytes', 'Bytes transmitted to the brokers')
+RDKAFKA_BROKER_RTT = Gauge('rdkafka_broker_rtt_avg_seconds', 'Average broker round-trip time', ['broker'])
+RDKAFKA_BROKER_INT_LATENCY = Gauge('rdkafka_broker_int_latency_avg_seconds',
+                                   'Average time a message waits in the producer queue before it is sent',
+                                   ['broker'])
+RDKAFKA_BROKER_OUTBUF = Gauge('rdkafka_broker_outbuf_cnt', 'Requests waiting to be sent to the broker', ['broker'])
+RDKAFKA_BATCH_SIZE = Gauge('rdkafka_topic_batchsize_avg_bytes', 'Average batch size', ['topic'])
+RDKAFKA_BATCH_CNT = Gauge('rdkafka_topic_batchcnt_avg', 'Average number of messages per batch', ['topic'])
+
+
+def start_metrics_server(port: int):
+    start_http_server(port)
+    print(f"Metrics available at http://0.0.0.0:{port}/metrics")
+
+
+# the queue depth is read from the producer whenever the endpoint is scraped
+def watch_producer(producer):
+    QUEUE_DEPTH.set_function(lambda: len(producer))
+
+
+def record_delivery(err, msg):
+    if err is not None:
+        DELIVERY_ERRORS.inc()
+        return
+    RECORDS_PRODUCED.inc()
+    BYTES_PRODUCED.inc(len(msg.value() or b''))
+    latency = msg.latency()
+    if latency is not None:
+        DELIVERY_LATENCY.observe(latency)
+
+
+# wrap a delivery callback to record the delivery metrics as well (callback=None: metrics only)
+def with_metrics(on_delivery=None):
+    if on_delivery is None:
+        return record_delivery
+
+    def callback(err, msg):
+        record_delivery(err, msg)
+        on_delivery(err, msg)
+    return callback
+
+
+# use as stats_cb of the producer (statistics.interval.ms needs to be set)
+def on_stats(stats_json: str):
+    stats = json.loads(stats_json)
+    RDKAFKA_MSG_CNT.set(stats.get('msg_cnt', 0))
+    RDKAFKA_MSG_SIZE.set(stats.get('msg_size', 0))
+    RDKAFKA_TXMSGS.set(stats.get('txmsgs', 0))
+    RDKAFKA_TX_BYTES.set(stats.get('txmsg_bytes', 0))
+    for broker in stats.get('brokers', {}).values():
+        name = broker.get('nodename') or broker.get('name')
+        # librdkafka reports the window statistics in microseconds
+        RDKAFKA_BROKER_RTT.labels(name).set(broker.get('rtt', {}).get('avg', 0) / 1_000_000)
+        RDKAFKA_BROKER_INT_LATENCY.labels(name).set(broker.get('int_latency', {}).get('avg', 0) / 1_000_000)
+        RDKAFKA_BROKER_OUTBUF.labels(name).set(broker.get('outbuf_cnt', 0))
+    for topic, topic_stats in stats.get('topics', {}).items():
+        RDKAFKA_BATCH_SIZE.labels(topic).set(topic_stats.get('batchsize', {}).get('avg', 0))
+        RDKAFKA_BATCH_CNT.labels(topic).set(topic_stats.get('batchcnt', {}).get('avg', 0))
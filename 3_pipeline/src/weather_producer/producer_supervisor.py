@@ -0,0 +1,147 @@
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+
+import kafka_weather_producer
+from backpressure import stop_on_sigterm
+from kafka_weather_producer import get_env_default
+from weather_locations import Location, load_locations
+
+# Supervisor: shards a (large) location list over N worker processes, each worker runs the regular producer
+# (kafka_weather_producer.main) with its own Producer, watermark state file, transactional.id and metrics port.
+# Crashed workers are restarted with a backoff; SIGTERM is forwarded so every worker drains and flushes.
+
+# exit codes of kafka_weather_producer.main which are no crash (2: some locations could not be fetched)
+FINISHED_EXIT_CODES = {0, 2}
+
+
+# rendezvous hashing: a location always belongs to the same shard, changing the number of shards only moves
+# the locations of the added/removed shard - the watermarks of the other locations stay with their worker
+def shard_of(location_name: str, shards: int) -> int:
+    return max(range(shards), key=lambda shard: hashlib.sha1(f"{shard}:{location_name}".encode('utf-8')).digest())
+
+
+def assign_shards(locations: list[Location], shards: int) -> list[list[Location]]:
+    assignment = [[] for _ in range(shards)]
+    for location in locations:
+        assignment[shard_of(location.name, shards)].append(location)
+    return assignment
+
+
+# the locations of a shard are handed over to the worker as a locations file
+def write_shard_file(path: str, locations: list[Location]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([{'name': location.name, 'lat': location.lat, 'long': location.long} for location in locations], f)
+
+
+# environment of a worker: the settings of the supervisor, the shard specific ones are overridden
+def worker_env(shard: int, shard_file: str, state_dir: str) -> dict:
+    env = {
+        'WEATHER_LOCATIONS_FILE': shard_file,
+        'WATERMARK_STATE_PATH': os.path.join(state_dir, f"watermarks-shard-{shard}.json"),
+    }
+    transactional_id = get_env_default("KAFKA_TRANSACTIONAL_ID", "")
+    if transactional_id != "":
+        env['KAFKA_TRANSACTIONAL_ID'] = f"{transactional_id}-{shard}"
+    metrics_port = get_env_default("METRICS_PORT", "")
+    if metrics_port != "":
+        env['METRICS_PORT'] = str(int(metrics_port) + shard)
+    return env
+
+
+def run_worker(env: dict):
+    os.environ.update(env)
+    kafka_weather_producer.main()
+
+
+def start_worker(context, shard: int, env: dict):
+    process = context.Process(target=run_worker, args=(env,), name=f"producer-shard-{shard}")
+    process.start()
+    print(f"Started worker {shard} (pid {process.pid})")
+    return process
+
+
+# run the workers until they are finished (once mode) or SIGTERM (daemon mode), restart crashed workers
+# returns the number of workers which did not finish successfully
+def supervise(envs: dict[int, dict], max_restarts: int, restart_backoff_seconds: float,
+              stop_timeout_seconds: float) -> int:
+    # spawn: a fresh interpreter per worker, no forked librdkafka threads/signal handlers
+    context = multiprocessing.get_context('spawn')
+    stop = stop_on_sigterm()
+    workers = {shard: start_worker(context, shard, env) for shard, env in envs.items()}
+    restarts = {shard: 0 for shard in envs}
+    failed = 0
+
+    while workers and not stop.is_set():
+        multiprocessing.connection.wait([process.sentinel for process in workers.values()], timeout=1.0)
+        for shard, process in list(workers.items()):
+            if process.is_alive():
+                continue
+            del workers[shard]
+            if process.exitcode in FINISHED_EXIT_CODES:
+                if process.exitcode != 0:
+                    failed += 1
+                print(f"Worker {shard} finished (exit code {process.exitcode})")
+                continue
+            if stop.is_set():
+                continue
+            if restarts[shard] >= max_restarts:
+                failed += 1
+                print(f"Worker {shard} failed (exit code {process.exitcode}), giving up after {max_restarts} restarts")
+                continue
+            restarts[shard] += 1
+            delay = restart_backoff_seconds * (2 ** (restarts[shard] - 1))
+            print(f"Worker {shard} failed (exit code {process.exitcode}), restart {restarts[shard]} in {delay:.1f}s")
+            if not stop.wait(delay):
+                workers[shard] = start_worker(context, shard, envs[shard])
+
+    # forward SIGTERM, the workers stop fetching, publish what is queued and flush
+    for process in workers.values():
+        process.terminate()
+    deadline = time.monotonic() + stop_timeout_seconds
+    for shard, process in workers.items():
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            print(f"Worker {shard} did not stop within {stop_timeout_seconds:.0f}s, killing it")
+            process.kill()
+            process.join()
+    return failed
+
+
+def main():
+    locations = load_locations(get_env_default("WEATHER_LOCATIONS_FILE", ""),
+                               get_env_default("WEATHER_LOCATIONS", ""))
+    if not locations:
+        print("No locations given, set WEATHER_LOCATIONS_FILE or WEATHER_LOCATIONS")
+        sys.exit(2)
+    workers = int(get_env_default("PRODUCER_WORKERS", str(os.cpu_count() or 1)))
+    state_dir = get_env_default("SUPERVISOR_STATE_DIR", "state")
+
+    envs = {}
+    for shard, shard_locations in enumerate(assign_shards(locations, workers)):
+        if not shard_locations:
+            continue
+        shard_file = os.path.join(state_dir, "shards", f"shard-{shard}.json")
+        write_shard_file(shard_file, shard_locations)
+        envs[shard] = worker_env(shard, shard_file, state_dir)
+        print(f"Shard {shard}: {len(shard_locations)} locations")
+
+    failed = supervise(envs,
+                       max_restarts=int(get_env_default("SUPERVISOR_MAX_RESTARTS", "5")),
+                       restart_backoff_seconds=float(get_env_default("SUPERVISOR_RESTART_BACKOFF_SECONDS", "1")),
+                       stop_timeout_seconds=float(get_env_default("SHUTDOWN_FLUSH_TIMEOUT_SECONDS", "30")) + 10)
+    sys.exit(2 if failed > 0 else 0)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    except Exception as err:
+        print(f"Got Error {err=}, {type(err)=}")
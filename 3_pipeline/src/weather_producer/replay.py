@@ -0,0 +1,86 @@
+import csv
+import datetime
+import time
+
+from backpressure import produce_blocking
+from weather_locations import message_key
+
+# synthetic locations are spread around Puch-Urstein
+BASE_LAT = 47.72
+BASE_LONG = 13.09
+
+
+# read the rows of the weather csv (date,temperature,humidity,wind_speed) as records
+def read_csv_records(csv_path: str):
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            event_time = datetime.datetime.fromisoformat(row['date'])
+            yield event_time, {
+                'timestamp': event_time.strftime('%Y-%m-%dT%H:%M'),
+                'temperature': float(row['temperature']),
+                'humidity': float(row['humidity']),
+                'wind_speed': float(row['wind_speed'])
+            }
+
+
+# Replay the csv into the topic:
+# - rate: max. messages/sec (0 = as fast as possible)
+# - time_compression: replay the event time compressed by the factor (e.g. 86400 = one day per second, 0 = off)
+# - synthetic_locations: every row is sent once per synthetic location
+def replay_csv(producer, csv_path, kafka_topic, serialize, on_delivery, rate=0.0, time_compression=0.0,
+               synthetic_locations=0, loops=1, report_seconds=5.0, key_mode='location'):
+    report = {'sent': 0, 'buffer_errors': 0}
+    locations = [(f"synthetic-{i}", round(BASE_LAT + i * 0.01, 4), round(BASE_LONG + i * 0.01, 4))
+                 for i in range(synthetic_locations)]
+    rows = list(read_csv_records(csv_path))
+    if not rows:
+        return report
+    first_event_time = rows[0][0]
+    # event time span of one pass, the next loop continues after the last row
+    step = rows[1][0] - rows[0][0] if len(rows) > 1 else datetime.timedelta(0)
+    loop_span = (rows[-1][0] - first_event_time + step).total_seconds()
+
+    start = time.monotonic()
+    last_report, last_sent = start, 0
+    for loop in range(loops):
+        for event_time, record in rows:
+            event_offset = (event_time - first_event_time).total_seconds() + loop * loop_span
+
+            for location in locations or [None]:
+                message = record
+                location_key = f"{BASE_LAT},{BASE_LONG}"
+                if location is not None:
+                    name, lat, long = location
+                    message = {**record, 'location': name, 'latitude': lat, 'longitude': long}
+                    location_key = name
+
+                # pacing: the message is due by rate and/or by the compressed event time
+                due = start
+                if rate > 0:
+                    due = max(due, start + report['sent'] / rate)
+                if time_compression > 0:
+                    due = max(due, start + event_offset / time_compression)
+                # serve delivery callbacks while waiting, poll returns early if there are events
+                while (wait := due - time.monotonic()) > 0:
+                    producer.poll(wait)
+
+                key = message_key(key_mode, location_key, message['timestamp'])
+                # a full local queue blocks until deliveries have freed space
+                if produce_blocking(producer, kafka_topic, serialize(message), key=key, on_delivery=on_delivery):
+                    report['buffer_errors'] += 1
+                report['sent'] += 1
+                producer.poll(0)
+
+                now = time.monotonic()
+                if now - last_report >= report_seconds:
+                    print(f"Replay: {report['sent']} messages, current rate: "
+                          f"{(report['sent'] - last_sent) / (now - last_report):,.0f} msg/s, "
+                          f"backpressure events: {report['buffer_errors']}")
+                    last_report, last_sent = now, report['sent']
+    producer.flush()
+
+    elapsed = time.monotonic() - start
+    print(f"Replay finished: {report['sent']} messages in {elapsed:.1f}s, "
+          f"achieved rate: {report['sent'] / elapsed if elapsed > 0 else 0:,.0f} msg/s "
+          f"(target: {rate or 'unlimited'}), backpressure events: {report['buffer_errors']}")
+    return report
@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+
+
+# A file-backed stand-in for a schema registry.
+# Schemas get a global id, every subject keeps the ordered list of its schema ids (version = position + 1).
+# {
+#   "schemas": {"1": {...avro schema...}},
+#   "subjects": {"weather-data-pipeline-value": [1]}
+# }
+class LocalSchemaRegistry:
+    def __init__(self, path: str):
+        self.path = path
+        self._data = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {'schemas': {}, 'subjects': {}}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    # write to a temp file first and replace the registry, readers never see a half-written file
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    # register the schema for the subject; an already known schema returns its existing id
+    def register(self, subject: str, schema: dict) -> int:
+        self._data = self._load()
+        for schema_id, known in self._data['schemas'].items():
+            if known == schema:
+                versions = self._data['subjects'].setdefault(subject, [])
+                if int(schema_id) not in versions:
+                    versions.append(int(schema_id))
+                    self._save()
+                return int(schema_id)
+
+        schema_id = max((int(i) for i in self._data['schemas']), default=0) + 1
+        self._data['schemas'][str(schema_id)] = schema
+        self._data['subjects'].setdefault(subject, []).append(schema_id)
+        self._save()
+        return schema_id
+
+    def get_schema(self, schema_id: int) -> dict:
+        return self._data['schemas'][str(schema_id)]
+
+    # returns (schema_id, version) of the latest schema of the subject
+    def latest(self, subject: str):
+        versions = self._data['subjects'][subject]
+        return versions[-1], len(versions)
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import async_fetcher
+from http_cache import ResponseCache, cached_get_json
+from weather_locations import Location
+
+# Tests of the response cache against a local stand-in of the Open-Meteo API (http.server on a free port), for the
+# synchronous (cached_get_json) and the asynchronous (async_fetcher.fetch_location) fetch path.
+#   cd 3_pipeline/src/weather_producer && python -m unittest test_http_cache
+
+ETAG = '"v1"'
+LAST_MODIFIED = 'Mon, 02 Jun 2025 10:00:00 GMT'
+# the slow upstream answers after this time, longer than the stale_timeout_seconds of the cache
+SLOW_SECONDS = 1.5
+STALE_TIMEOUT_SECONDS = 0.3
+
+
+class Upstream(BaseHTTPRequestHandler):
+    # set by the tests: 'ok', 'down' (503), 'closed' (connection closed without a response) or 'slow' (answers after
+    # SLOW_SECONDS)
+    mode = 'ok'
+    cache_control = 'max-age=0'
+    requests = []
+
+    def do_GET(self):
+        Upstream.requests.append(dict(self.headers))
+        if Upstream.mode == 'down':
+            self.send_response(503)
+            self.end_headers()
+            return
+        if Upstream.mode == 'closed':
+            self.close_connection = True
+            return
+        if Upstream.mode == 'slow':
+            time.sleep(SLOW_SECONDS)
+        if self.headers.get('If-None-Match') == ETAG or self.headers.get('If-Modified-Since') == LAST_MODIFIED:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.send_header('Cache-Control', Upstream.cache_control)
+            self.end_headers()
+            return
+        body = json.dumps({'response': len(Upstream.requests)}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', ETAG)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Cache-Control', Upstream.cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ResponseCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Upstream)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1/forecast"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Upstream.mode, Upstream.cache_control, Upstream.requests = 'ok', 'max-age=0', []
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = ResponseCache(directory.name, max_stale_seconds=3600.0,
+                                   stale_timeout_seconds=STALE_TIMEOUT_SECONDS)
+        self.params = {'latitude': '47.70', 'longitude': 13.0}
+
+    def test_fresh_entry_is_used_without_request(self):
+        Upstream.cache_control = 'max-age=600'
+        first = cached_get_json(self.cache, self.url, self.params)
+        # the same request with differently formatted parameters
+        second = cached_get_json(self.cache, self.url, {'longitude': '13', 'latitude': 47.7})
+        self.assertEqual(first, {'response': 1})
+        self.assertEqual(second, first)
+        self.assertEqual(len(Upstream.requests), 1)
+
+    def test_stale_entry_is_revalidated(self):
+        first = cached_get_json(self.cache, self.url, self.params)
+        second = cached_get_json(self.cache, self.url, self.params)
+        self.assertEqual(second, first)
+        self.assertEqual(len(Upstream.requests), 2)
+        self.assertEqual(Upstream.requests[1].get('If-None-Match'), ETAG)
+        self.assertEqual(Upstream.requests[1].get('If-Modified-Since'), LAST_MODIFIED)
+
+    def test_revalidation_takes_over_freshness(self):
+        cached_get_json(self.cache, self.url, self.params)
+        Upstream.cache_control = 'max-age=600'
+        cached_get_json(self.cache, self.url, self.params)
+        entry = self.cache.lookup(self.url, self.params)
+        self.assertTrue(self.cache.is_fresh(entry))
+        self.assertEqual(cached_get_json(self.cache, self.url, self.params), {'response': 1})
+        self.assertEqual(len(Upstream.requests), 2)
+
+    def test_stale_entry_is_used_if_upstream_fails(self):
+        first = cached_get_json(self.cache, self.url, self.params)
+        for mode in ('down', 'closed'):
+            with self.subTest(mode=mode):
+                Upstream.mode = mode
+                self.assertEqual(cached_get_json(self.cache, self.url, self.params), first)
+
+    def test_stale_entry_is_used_if_upstream_is_slow(self):
+        first = cached_get_json(self.cache, self.url, self.params)
+        Upstream.mode = 'slow'
+        started = time.perf_counter()
+        body = cached_get_json(self.cache, self.url, self.params)
+        # the request is given up after stale_timeout_seconds, not after the (longer) default timeout
+        self.assertLess(time.perf_counter() - started, SLOW_SECONDS)
+        self.assertEqual(body, first)
+        self.assertEqual(self.cache.stale_responses, 1)
+
+    def test_failure_without_usable_entry_raises(self):
+        Upstream.mode = 'down'
+        with self.assertRaises(Exception):
+            cached_get_json(self.cache, self.url, self.params)
+        # too old to be used
+        Upstream.mode = 'ok'
+        cached_get_json(self.cache, self.url, self.params)
+        self.cache.max_stale_seconds = 0.0
+        Upstream.mode = 'down'
+        with self.assertRaises(Exception):
+            cached_get_json(self.cache, self.url, self.params)
+
+    def test_no_store_is_not_cached(self):
+        Upstream.cache_control = 'no-store'
+        cached_get_json(self.cache, self.url, self.params)
+        self.assertIsNone(self.cache.lookup(self.url, self.params))
+
+    def fetch_async(self, location: Location):
+        async def fetch():
+            async with async_fetcher.create_session(1, 5.0) as session:
+                return await async_fetcher.fetch_location(session, asyncio.Semaphore(1), location, 1, retries=0,
+                                                          backoff_seconds=0.0, cache=self.cache)
+
+        with mock.patch.object(async_fetcher, 'OPEN_METEO_URL', self.url):
+            return asyncio.run(fetch())
+
+    def test_async_fetch(self):
+        location = Location('Linz', '48.30', '14.29')
+        first = self.fetch_async(location)
+        # stale: revalidated with the validators of the entry
+        self.assertEqual(self.fetch_async(location), first)
+        self.assertEqual(Upstream.requests[1].get('If-None-Match'), ETAG)
+        # upstream down or too slow: the stale entry is used
+        Upstream.mode = 'down'
+        self.assertEqual(self.fetch_async(location), first)
+        Upstream.mode = 'slow'
+        started = time.perf_counter()
+        self.assertEqual(self.fetch_async(location), first)
+        self.assertLess(time.perf_counter() - started, SLOW_SECONDS)
+        self.assertEqual(self.cache.stale_responses, 2)
+        # fresh: no request
+        Upstream.mode, Upstream.cache_control = 'ok', 'max-age=600'
+        self.fetch_async(location)
+        requests = len(Upstream.requests)
+        self.assertEqual(self.fetch_async(location), first)
+        self.assertEqual(len(Upstream.requests), requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import unittest
+
+import pyarrow as pa
+
+from weather_locations import Location
+from weather_serializer import ArrowBatchSerializer, ColumnarJsonSerializer, arrow_schema, json_serialize
+
+# Tests of the bulk encodings: the same messages as the per-record serialization
+#   cd 3_pipeline/src/weather_producer && python -m unittest test_weather_serializer
+
+HOURLY_DATA = {
+    'time': ['2025-06-01T00:00', '2025-06-01T01:00'],
+    'temperature_2m': [12.5, None],
+    'relative_humidity_2m': [80, 81],
+    'wind_speed_10m': [None, 3.2],
+}
+
+
+def ipc_schema(payload: bytes) -> pa.Schema:
+    return pa.ipc.open_stream(payload).schema
+
+
+class ColumnarJsonSerializerTest(unittest.TestCase):
+    def test_strings_are_escaped_like_json_dumps(self):
+        for name in ['Linz "Ost" \\ Urfahr', 'Line\nbreak\ttab\r\b\f', 'nul\x00unit\x1f', 'del\x7f', 'Zürich',
+                     'Kraków \U0001F327']:
+            with self.subTest(name=name):
+                for _, payload in ColumnarJsonSerializer().encode_columns(HOURLY_DATA, Location(name, '47.7', '13')):
+                    record = json.loads(payload)
+                    self.assertEqual(record['location'], name)
+                    self.assertEqual(payload, json_serialize(record))
+
+
+class ArrowBatchSerializerTest(unittest.TestCase):
+    def test_batches_have_the_schema_of_the_topic(self):
+        serializer = ArrowBatchSerializer()
+        for location in (None, Location('Linz', '48.3', '14.3')):
+            with self.subTest(location=location):
+                names = ['timestamp', 'temperature', 'humidity', 'wind_speed']
+                if location is not None:
+                    names += ['location', 'latitude', 'longitude']
+                for _, payload in serializer.encode_columns(HOURLY_DATA, location):
+                    self.assertEqual(ipc_schema(payload), arrow_schema(names))
+
+    def test_single_records_are_refused(self):
+        with self.assertRaises(ValueError):
+            ArrowBatchSerializer()({'timestamp': '2025-06-01T00:00', 'temperature': 12.5})
+
+
+if __name__ == '__main__':
+    unittest.main()
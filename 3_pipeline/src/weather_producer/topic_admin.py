@@ -0,0 +1,53 @@
+import sys
+
+from confluent_kafka.admin import AdminClient, NewPartitions, NewTopic
+
+from kafka_weather_producer import get_env_default
+
+# Create the topic or resize it to the given number of partitions.
+# The partition count limits the parallelism of the consumers (e.g. the tasks of the spark kafka source),
+# choose it according to the expected consumer parallelism.
+# NOTE: partitions can only be added; adding partitions changes the key -> partition mapping for new messages
+
+
+def ensure_topic(admin: AdminClient, topic: str, partitions: int, replication_factor: int, timeout: float = 30.0):
+    metadata = admin.list_topics(timeout=timeout)
+    existing = metadata.topics.get(topic)
+
+    if existing is None or existing.error is not None:
+        futures = admin.create_topics([NewTopic(topic, num_partitions=partitions,
+                                                replication_factor=replication_factor)])
+        futures[topic].result(timeout)
+        print(f"Created topic {topic} with {partitions} partitions")
+        return
+
+    current = len(existing.partitions)
+    if current < partitions:
+        futures = admin.create_partitions([NewPartitions(topic, partitions)])
+        futures[topic].result(timeout)
+        print(f"Resized topic {topic} from {current} to {partitions} partitions")
+    elif current > partitions:
+        print(f"Topic {topic} has {current} partitions, the number of partitions cannot be reduced")
+    else:
+        print(f"Topic {topic} already has {partitions} partitions")
+
+
+def main():
+    kafka_broker = get_env_default("KAFKA_BROKER", "localhost:19092")
+    kafka_topic = get_env_default("KAFKA_TOPIC", "weather-data-pipeline")
+    # e.g. the number of spark executor cores which consume the topic
+    consumer_parallelism = int(get_env_default("CONSUMER_PARALLELISM", "6"))
+    partitions = int(get_env_default("TOPIC_PARTITIONS", str(consumer_parallelism)))
+    replication_factor = int(get_env_default("TOPIC_REPLICATION_FACTOR", "1"))
+
+    admin = AdminClient({'bootstrap.servers': kafka_broker})
+    ensure_topic(admin, kafka_topic, partitions, replication_factor)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as err:
+        print(f"Got Error {err=}, {type(err)=}")
+        sys.exit(1)
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import tempfile
+
+
+# hash of the values of a single hour, a changed forecast results in a different hash
+def hour_hash(temperature, humidity, wind_speed) -> str:
+    values = json.dumps([temperature, humidity, wind_speed]).encode('utf-8')
+    return hashlib.sha1(values).hexdigest()[:16]
+
+
+# Per-location high-watermark persisted in a local state file:
+# the value-hash of every published hour of the current forecast window.
+# {
+#   "47.72,13.09": {"hours": {"2025-06-01T00:00": "ab12...", ...}}
+# }
+class WatermarkState:
+    def __init__(self, path: str):
+        self.path = path
+        self._state = {}
+        self._pending = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self._state = json.load(f)
+
+    # returns the weather-data reduced to the hours which are new or whose values changed since the last publish
+    # the changes are kept as pending until commit() is called
+    def filter_new_hours(self, location_key: str, weather_data):
+        hourly_data = weather_data['hourly']
+        known = self._state.get(location_key, {}).get('hours', {})
+        hashes = {}
+        selected = []
+        for i, timestamp in enumerate(hourly_data['time']):
+            value_hash = hour_hash(hourly_data['temperature_2m'][i],
+                                   hourly_data['relative_humidity_2m'][i],
+                                   hourly_data['wind_speed_10m'][i])
+            hashes[timestamp] = value_hash
+            if known.get(timestamp) != value_hash:
+                selected.append(i)
+        self._pending[location_key] = hashes
+
+        filtered = {key: [values[i] for i in selected] for key, values in hourly_data.items()}
+        return {**weather_data, 'hourly': filtered}
+
+    # accept the pending changes (after the records were delivered) and persist the state
+    # location_keys: only commit these locations (e.g. after their transaction was committed), default: all
+    def commit(self, location_keys=None):
+        keys = list(self._pending) if location_keys is None else location_keys
+        for location_key in keys:
+            hashes = self._pending.pop(location_key, None)
+            if hashes is None:
+                continue
+            # only the hours of the current forecast window are kept, older hours are not sent again
+            self._state[location_key] = {'hours': hashes}
+        self._save()
+
+    # drop the pending changes, e.g. if the delivery failed - the hours are published again in the next run
+    def rollback(self, location_keys=None):
+        if location_keys is None:
+            self._pending = {}
+            return
+        for location_key in location_keys:
+            self._pending.pop(location_key, None)
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self.path)
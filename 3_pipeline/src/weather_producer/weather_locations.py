@@ -0,0 +1,59 @@
+import csv
+import json
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Location:
+    name: str
+    lat: str
+    long: str
+
+
+# parse locations given inline, e.g. "47.72,13.09;48.21,16.37" or "fh=47.72,13.09;vienna=48.21,16.37"
+def parse_locations(value: str) -> list[Location]:
+    locations = []
+    for entry in value.split(";"):
+        entry = entry.strip()
+        if entry == "":
+            continue
+        name = None
+        if "=" in entry:
+            name, entry = entry.split("=", 1)
+        lat, long = [part.strip() for part in entry.split(",")]
+        locations.append(Location(name=(name or f"{lat},{long}").strip(), lat=lat, long=long))
+    return locations
+
+
+# load locations from a file - either a JSON list of {name, lat, long} objects
+# or a CSV file with the header: name,lat,long
+def load_locations_file(path: str) -> list[Location]:
+    with open(path, newline="", encoding="utf-8") as f:
+        if os.path.splitext(path)[1].lower() == ".json":
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    return [Location(name=str(row.get("name") or f"{row['lat']},{row['long']}"),
+                     lat=str(row["lat"]),
+                     long=str(row["long"])) for row in rows]
+
+
+# the file takes precedence over the inline definition
+def load_locations(locations_file: str, locations: str) -> list[Location]:
+    if locations_file:
+        return load_locations_file(locations_file)
+    return parse_locations(locations)
+
+
+# the message key decides the partition: all records of a location (or a location/day) land in the same
+# partition and keep their order
+# key_mode: none | location | location_day
+def message_key(key_mode: str, location_key: str, timestamp: str):
+    if key_mode == "none":
+        return None
+    if key_mode == "location":
+        return location_key.encode("utf-8")
+    if key_mode == "location_day":
+        return f"{location_key}|{timestamp[:10]}".encode("utf-8")
+    raise ValueError(f"Unknown key mode '{key_mode}', use none, location or location_day")
@@ -0,0 +1,164 @@
+import io
+import json
+import struct
+
+import fastavro
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from schema_registry import LocalSchemaRegistry
+
+# the avro schema of a single hourly weather record
+# the location fields are optional, they are only set if multiple locations are fetched
+WEATHER_RECORD_SCHEMA = {
+    'type': 'record',
+    'name': 'WeatherRecord',
+    'namespace': 'weather_producer',
+    'fields': [
+        {'name': 'timestamp', 'type': 'string'},
+        {'name': 'temperature', 'type': ['null', 'double'], 'default': None},
+        {'name': 'humidity', 'type': ['null', 'double'], 'default': None},
+        {'name': 'wind_speed', 'type': ['null', 'double'], 'default': None},
+        {'name': 'location', 'type': ['null', 'string'], 'default': None},
+        {'name': 'latitude', 'type': ['null', 'double'], 'default': None},
+        {'name': 'longitude', 'type': ['null', 'double'], 'default': None},
+    ]
+}
+
+# the same fields as arrow schema, every arrow message of the topic uses these types
+# (the location fields are only part of the messages if the records are tagged with the location)
+WEATHER_ARROW_SCHEMA = pa.schema([
+    ('timestamp', pa.string()),
+    ('temperature', pa.float64()),
+    ('humidity', pa.float64()),
+    ('wind_speed', pa.float64()),
+    ('location', pa.string()),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+])
+
+# first byte of a schema-tagged message (same wire format as the confluent schema registry):
+# magic byte 0 | schema id (4 bytes, big endian) | avro encoded record
+MAGIC_BYTE = 0
+
+
+def json_serialize(record: dict) -> bytes:
+    return json.dumps(record).encode('utf-8')
+
+
+# binary avro encoding, every message is tagged with the id of the schema in the registry
+class AvroSerializer:
+    def __init__(self, registry: LocalSchemaRegistry, subject: str, schema: dict = WEATHER_RECORD_SCHEMA):
+        self.schema_id = registry.register(subject, schema)
+        self._header = struct.pack('>bI', MAGIC_BYTE, self.schema_id)
+        self._parsed_schema = fastavro.parse_schema(schema)
+
+    def __call__(self, record: dict) -> bytes:
+        buffer = io.BytesIO()
+        buffer.write(self._header)
+        fastavro.schemaless_writer(buffer, self._parsed_schema, record)
+        return buffer.getvalue()
+
+
+def avro_deserialize(registry: LocalSchemaRegistry, payload: bytes) -> dict:
+    magic, schema_id = struct.unpack('>bI', payload[:5])
+    if magic != MAGIC_BYTE:
+        raise ValueError(f"Unknown magic byte {magic}")
+    schema = fastavro.parse_schema(registry.get_schema(schema_id))
+    return fastavro.schemaless_reader(io.BytesIO(payload[5:]), schema)
+
+
+# the schema of the given fields (in the order of WEATHER_ARROW_SCHEMA)
+def arrow_schema(names) -> pa.Schema:
+    return pa.schema([field for field in WEATHER_ARROW_SCHEMA if field.name in names])
+
+
+# the hourly column arrays as arrow table, optionally tagged with the location
+def hourly_table(hourly_data, location=None) -> pa.Table:
+    columns = {
+        'timestamp': hourly_data['time'],
+        'temperature': hourly_data['temperature_2m'],
+        'humidity': hourly_data['relative_humidity_2m'],
+        'wind_speed': hourly_data['wind_speed_10m'],
+    }
+    if location is not None:
+        rows = len(hourly_data['time'])
+        columns['location'] = [location.name] * rows
+        columns['latitude'] = [float(location.lat)] * rows
+        columns['longitude'] = [float(location.long)] * rows
+    return pa.table(columns, schema=arrow_schema(columns))
+
+
+# the string column as json strings, escaped like json.dumps (ensure_ascii, as json_serialize)
+def json_strings(column):
+    # control and non-ASCII characters are rare (e.g. in a location name): the distinct values of such a column
+    # are escaped by json.dumps itself (the location name is the same for all hours)
+    if pc.any(pc.match_substring_regex(column, '[^\\x20-\\x7e]')).as_py():
+        encoded = pc.dictionary_encode(column.combine_chunks())
+        dictionary = pa.array([json.dumps(value) for value in encoded.dictionary.to_pylist()], pa.string())
+        return dictionary.take(encoded.indices)
+    escaped = pc.replace_substring(pc.replace_substring(column, '\\', '\\\\'), '"', '\\"')
+    return pc.binary_join_element_wise('"', escaped, '"', '')
+
+
+# Encodes all hours of a response as JSON payloads in bulk: the number columns are formatted by arrow and
+# concatenated with the field names, no dict/json.dumps per record.
+# Single records (e.g. replay) use the regular json serialization.
+class ColumnarJsonSerializer:
+    def __call__(self, record: dict) -> bytes:
+        return json_serialize(record)
+
+    # returns the list of (timestamp, payload) of all hours
+    def encode_columns(self, hourly_data, location=None):
+        table = hourly_table(hourly_data, location)
+        parts = []
+        for i, name in enumerate(table.column_names):
+            column = table.column(name)
+            if pa.types.is_string(column.type):
+                text = json_strings(column)
+            else:
+                text = pc.cast(column, pa.string())
+            parts.append(f'{"{" if i == 0 else ", "}"{name}": ')
+            parts.append(pc.fill_null(text, 'null'))
+        parts.append('}')
+        payloads = pc.binary_join_element_wise(*parts, '')
+        return list(zip(hourly_data['time'], payloads.cast(pa.binary()).to_pylist()))
+
+
+# Packs batch_hours hours into one Arrow IPC stream message. The messages start with the IPC continuation
+# marker 0xFFFFFFFF, the bronze notebook decodes them into single records again.
+class ArrowBatchSerializer:
+    def __init__(self, batch_hours: int = 24):
+        self.batch_hours = batch_hours
+
+    @staticmethod
+    def _ipc(table: pa.Table) -> bytes:
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    # single records (e.g. replay) are refused: an IPC stream per record (schema + batch) is ~10x the size of json
+    def __call__(self, record: dict) -> bytes:
+        raise ValueError("The arrow format packs several hours per message, single records are not supported "
+                         "(use json, json_columnar or avro)")
+
+    # returns the list of (timestamp of the first hour, payload) of all batches
+    def encode_columns(self, hourly_data, location=None):
+        table = hourly_table(hourly_data, location)
+        return [(hourly_data['time'][offset], self._ipc(table.slice(offset, self.batch_hours)))
+                for offset in range(0, table.num_rows, self.batch_hours)]
+
+
+# the serializer is selected by name:
+# json (default), json_columnar (bulk json encoding), avro (schema-tagged) or arrow (N hours per message)
+def create_serializer(name: str, registry_path: str, subject: str, arrow_batch_hours: int = 24):
+    if name == 'json':
+        return json_serialize
+    if name == 'json_columnar':
+        return ColumnarJsonSerializer()
+    if name == 'avro':
+        return AvroSerializer(LocalSchemaRegistry(registry_path), subject)
+    if name == 'arrow':
+        return ArrowBatchSerializer(arrow_batch_hours)
+    raise ValueError(f"Unknown serializer '{name}', use json, json_columnar, avro or arrow")
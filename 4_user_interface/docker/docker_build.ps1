@@ -1 +1 @@
-docker build -t streamlit_dashboard .
\ No newline at end of file
+docker build -t streamlit_dashboard --build-context pipeline_utils=../../3_pipeline/notebooks/pipeline_utils .
\ No newline at end of file
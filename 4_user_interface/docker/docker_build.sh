@@ -3,4 +3,5 @@
 docker build \
  -f Dockerfile \
  -t streamlit_dashboard \
+ --build-context pipeline_utils=../../3_pipeline/notebooks/pipeline_utils \
  ..
\ No newline at end of file
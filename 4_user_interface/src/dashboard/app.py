@@ -2,13 +2,12 @@
 #  Gold-Layer Dashboard  – Weather • Retail • Retail × Weather
 # ================================================================
 #
-#  TAB 1  🌤️ Weather            gold/weather/weather_aggregated.parquet
-#  TAB 2  🛒 Retail             gold/retail/retail_aggregated.parquet
-#  TAB 3  🔄 Retail × Weather   gold/retail_weather/retail_weather_combined.parquet
+#  TAB 1  🌤️ Weather            gold/weather/
+#  TAB 2  🛒 Retail             gold/retail/
+#  TAB 3  🔄 Retail × Weather   gold/retail_weather/
 # ----------------------------------------------------------------
 
 import os
-from io import BytesIO
 
 import boto3
 import matplotlib.pyplot as plt
@@ -18,6 +17,8 @@ import streamlit as st
 from st_aggrid import AgGrid, GridOptionsBuilder
 from streamlit_echarts import st_echarts
 
+from table_reader import latest_version, partition_values, read_version
+
 # ────────────────────────────────────────────────────────────────
 # Page-Setup & helpers
 # ────────────────────────────────────────────────────────────────
@@ -27,9 +28,9 @@ def env(key: str, default: str) -> str:
     return os.getenv(key, default)
 
 BUCKET      = env("BUCKET_NAME",        "batch-bucket")
-WEATHER_KEY = env("GOLD_FILE_NAME",     "gold/weather/weather_aggregated.parquet")
-RETAIL_KEY  = env("RETAIL_FILE_NAME",   "gold/retail/retail_aggregated.parquet")
-COMBO_KEY   = env("COMBINED_FILE_NAME", "gold/retail_weather/retail_weather_combined.parquet")
+WEATHER_TABLE = env("WEATHER_TABLE", "gold/weather/")
+RETAIL_TABLE  = env("RETAIL_TABLE",  "gold/retail/")
+COMBO_TABLE   = env("COMBO_TABLE",   "gold/retail_weather/")
 
 s3 = boto3.client(
     "s3",
@@ -38,14 +39,36 @@ s3 = boto3.client(
     aws_secret_access_key=env("MINIO_SECRET_KEY", "password"),
 )
 
-@st.cache_data(ttl="10m", show_spinner="📦 Lade Daten …")
-def read_parquet(key: str) -> pd.DataFrame:
-    obj = s3.get_object(Bucket=BUCKET, Key=key)
-    return pd.read_parquet(BytesIO(obj["Body"].read()))
-
-weather_df = read_parquet(WEATHER_KEY)
-retail_df  = read_parquet(RETAIL_KEY)
-combo_df   = read_parquet(COMBO_KEY)
+# the latest version is looked up from the table log (small JSON reads), a version never changes
+# and is only downloaded once
+@st.cache_data(ttl="30s", show_spinner=False)
+def current_version(table: str) -> int:
+    return latest_version(s3, BUCKET, table)
+
+# filters: tuple of (column, op, value) - only the matching partitions of the version are downloaded
+@st.cache_data(max_entries=16, show_spinner="📦 Lade Daten …")
+def read_table(table: str, version: int, filters: tuple = ()) -> pd.DataFrame:
+    return read_version(s3, BUCKET, table, version, filters)
+
+# the values of a partition column from the table log (tables written before the partitioning: from the data)
+@st.cache_data(show_spinner=False)
+def column_values(table: str, version: int, column: str) -> list:
+    values = partition_values(s3, BUCKET, table, version, column)
+    return values or sorted(read_table(table, version)[column].dropna().unique())
+
+# year range and stores are partitions of the retail tables
+def partition_filters(yr_rng, stores) -> tuple:
+    filters = (("year", ">=", yr_rng[0]), ("year", "<=", yr_rng[1]))
+    return filters + ((("store_name", "in", tuple(stores)),) if stores else ())
+
+# season, categories, store and product are categoricals: after filtering only the occurring categories are kept
+# (no empty bars/groups in the charts)
+def drop_unused(df: pd.DataFrame) -> pd.DataFrame:
+    return df.assign(**{col: df[col].cat.remove_unused_categories() for col in df.select_dtypes("category")})
+
+weather_df = read_table(WEATHER_TABLE, current_version(WEATHER_TABLE))
+retail_version = current_version(RETAIL_TABLE)
+combo_version  = current_version(COMBO_TABLE)
 
 # ----------------------------------------------------------------
 tab_w, tab_r, tab_c = st.tabs(["🌤️ Weather", "🛒 Retail", "🔄 Retail × Weather"])
@@ -84,6 +107,7 @@ with tab_w:
         wdf["avg_humidity"].between(*hum_rng) &
         wdf["avg_wind_speed"].between(*wind_rng)
     ]
+    wdf = drop_unused(wdf)
 
     # ─── KPIs ───────────────────────────────────────────────────
     k1, k2, k3, k4 = st.columns(4)
@@ -114,7 +138,7 @@ with tab_w:
         # Radar Chart
         st.subheader("Seasonal Averages (Radar)")
         rd = (
-            wdf.groupby("season")
+            wdf.groupby("season", observed=True)
                .agg(T=("avg_temp","mean"), H=("avg_humidity","mean"), W=("avg_wind_speed","mean"))
                .round(2).reset_index()
         )
@@ -138,23 +162,26 @@ with tab_w:
 with tab_r:
     st.header("Retail – Gold Layer")
 
-    stores_all  = sorted(retail_df["store_name"].unique())
-    prods_all   = sorted(retail_df["product_name"].unique())
-    seasons_all = sorted(retail_df["season"].unique())
+    stores_all = column_values(RETAIL_TABLE, retail_version, "store_name")
+    years_all  = column_values(RETAIL_TABLE, retail_version, "year")
 
     r1,r2,r3 = st.columns(3)
     sel_store = r1.multiselect("Store",  stores_all, stores_all, key="r_store")
-    sel_prod  = r2.multiselect("Product",prods_all,  prods_all,  key="r_prod")
-    sel_seas  = r3.multiselect("Season", seasons_all,seasons_all,key="r_sea")
 
-    y_min, y_max = int(retail_df["year"].min()), int(retail_df["year"].max())
+    y_min, y_max = int(years_all[0]), int(years_all[-1])
     yr_rng = st.slider("Year Range", y_min, y_max, (y_min, y_max), key="r_year")
 
+    # only the partitions of the selected years/stores are loaded
+    retail_df = read_table(RETAIL_TABLE, retail_version, partition_filters(yr_rng, sel_store))
+    prods_all   = sorted(retail_df["product_name"].unique())
+    seasons_all = sorted(retail_df["season"].unique())
+    sel_prod  = r2.multiselect("Product",prods_all,  prods_all,  key="r_prod")
+    sel_seas  = r3.multiselect("Season", seasons_all,seasons_all,key="r_sea")
+
     rdf = retail_df.copy()
-    if sel_store: rdf = rdf[rdf["store_name"].isin(sel_store)]
     if sel_prod:  rdf = rdf[rdf["product_name"].isin(sel_prod)]
     if sel_seas:  rdf = rdf[rdf["season"].isin(sel_seas)]
-    rdf = rdf[rdf["year"].between(*yr_rng)]
+    rdf = drop_unused(rdf)
 
     k1, k2, k3 = st.columns(3)
     k1.metric("Rows", f"{len(rdf):,}")
@@ -163,7 +190,7 @@ with tab_r:
 
     st.subheader("Revenue by Store")
     if not rdf.empty:
-        rev_store = rdf.groupby("store_name")["total_revenue"].sum().reset_index()
+        rev_store = rdf.groupby("store_name", observed=True)["total_revenue"].sum().reset_index()
         fig_r, ax_r = plt.subplots(figsize=(5,2))
         sns.barplot(data=rev_store, x="store_name", y="total_revenue", palette="rocket", ax=ax_r)
         ax_r.set_ylabel("Revenue (€)")
@@ -180,19 +207,26 @@ with tab_r:
 with tab_c:
     st.header("Retail × Weather – Combined Gold Layer")
 
-    stores_all  = sorted(combo_df["store_name"].unique())
-    prods_all   = sorted(combo_df["product_name"].unique())
-    seasons_all = sorted(combo_df["season_x"].unique())
+    stores_all = column_values(COMBO_TABLE, combo_version, "store_name")
+    years_all  = column_values(COMBO_TABLE, combo_version, "year")
 
     c1,c2,c3 = st.columns(3)
     f_store = c1.multiselect("Store",   stores_all, stores_all, key="c_store")
+
+    y_min, y_max = int(years_all[0]), int(years_all[-1])
+    f_years = st.slider("Year Range", y_min, y_max, (y_min, y_max), key="c_year")
+
+    # only the partitions of the selected years/stores are loaded
+    combo_df = read_table(COMBO_TABLE, combo_version, partition_filters(f_years, f_store))
+    prods_all   = sorted(combo_df["product_name"].unique())
+    seasons_all = sorted(combo_df["season_x"].unique())
     f_prod  = c2.multiselect("Product", prods_all,  prods_all,  key="c_prod")
     f_seas  = c3.multiselect("Season",  seasons_all,seasons_all,key="c_seas")
 
     cdf = combo_df.copy()
-    if f_store: cdf = cdf[cdf["store_name"].isin(f_store)]
     if f_prod:  cdf = cdf[cdf["product_name"].isin(f_prod)]
     if f_seas:  cdf = cdf[cdf["season_x"].isin(f_seas)]
+    cdf = drop_unused(cdf)
 
     k1,k2,k3 = st.columns(3)
     k1.metric("Rows", f"{len(cdf):,}")
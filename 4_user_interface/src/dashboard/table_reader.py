@@ -0,0 +1,67 @@
+import os
+import sys
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Read-only access to the tables written by the pipeline. The table format (commit log, snapshots, partition values
+# of the files) is shared with the writer: pipeline_utils/table_log.py of 3_pipeline/notebooks is copied into the
+# image (see docker/Dockerfile), a local checkout imports it from the pipeline folder.
+# The files of a version are immutable, a version can be cached as long as it is the latest.
+# Files of partitioned tables have the "values" of their partition columns (e.g. {"year": 2024, "store_name": ...}):
+# with filters only the files of the matching partitions are downloaded.
+try:
+    from pipeline_utils.table_log import Table, matches
+except ModuleNotFoundError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "3_pipeline",
+                                 "notebooks"))
+    from pipeline_utils.table_log import Table, matches
+
+# columns with few distinct values are loaded as dictionary columns (pandas categoricals: filtering and grouping
+# compare small integer codes), also from files which stored them as plain strings
+DICTIONARY_COLUMNS = ("season", "season_x", "season_y", "temperature_category", "wind_category", "store_name",
+                      "product_name")
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+
+# the latest committed version, -1 if the table has no commits
+def latest_version(s3, bucket: str, table: str) -> int:
+    return Table(s3, bucket, table).latest_version()
+
+
+def _snapshot(s3, bucket: str, table: str, version: int) -> dict:
+    return Table(s3, bucket, table).snapshot(version)
+
+
+# the distinct values of a partition column of the version (from the log, no data is read)
+def partition_values(s3, bucket: str, table: str, version: int, column: str) -> list:
+    if version < 0:
+        return []
+    values = {entry["values"][column] for entry in _snapshot(s3, bucket, table, version)["files"]
+              if column in entry.get("values", {})}
+    return sorted(value for value in values if value is not None)
+
+
+def _as_dictionaries(table: pa.Table) -> pa.Table:
+    for i, field in enumerate(table.schema):
+        if field.name in DICTIONARY_COLUMNS and field.type != DICTIONARY_TYPE:
+            table = table.set_column(i, field.name, table.column(i).cast(DICTIONARY_TYPE))
+    return table
+
+
+def read_version(s3, bucket: str, table: str, version: int, filters=None) -> pd.DataFrame:
+    if version < 0:
+        return pd.DataFrame()
+    filters = [tuple(predicate) for predicate in filters] if filters else None
+    files = _snapshot(s3, bucket, table, version)["files"]
+    # pruned by the partition values (if every file is pruned, one is read for the columns - its rows are filtered)
+    files = [entry for entry in files if matches(entry, filters)] or files[:1]
+    # the rows of the read files are filtered as well, row groups are skipped by their statistics
+    tables = [_as_dictionaries(pq.read_table(BytesIO(s3.get_object(Bucket=bucket, Key=entry["key"])["Body"].read()),
+                                             filters=filters))
+              for entry in files]
+    if not tables:
+        return pd.DataFrame()
+    return pa.concat_tables(tables, promote_options="permissive").to_pandas()